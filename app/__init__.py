@@ -1,20 +1,40 @@
+import time
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_migrate import Migrate
+from sqlalchemy import event
 
 
 from config import config
+from app.sharding import ShardedSession
 
 
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": ShardedSession})
 migrate = Migrate()
 cors = CORS()
 
 
+def _sqlite_transactions(engine):
+    """
+    SQLAlchemy's recipe for pysqlite's transaction handling: stop the driver
+    from issuing (and deferring) its own BEGIN and emit BEGIN when
+    SQLAlchemy starts a transaction, so SAVEPOINTs nest inside it.
+    """
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
 def create_app(config_name):
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
@@ -23,11 +43,37 @@ def create_app(config_name):
     migrate.init_app(app, db)
     cors.init_app(app, origins=["http://localhost:3000"])
     
+    if app.config.get("PRODUCT_SHARDS"):
+        from app.sharding import ShardRouter
+        app.extensions["product_shards"] = ShardRouter(app, app.config["PRODUCT_SHARDS"])
+    
+    with app.app_context():
+        engines = [db.engine]
+    if "product_shards" in app.extensions:
+        engines += app.extensions["product_shards"].engines
+    for engine in engines:
+        if engine.dialect.name == "sqlite":
+            _sqlite_transactions(engine)
+    
+    if app.config.get("PRODUCT_GROUP_COMMIT"):
+        from app.group_commit import GroupCommitQueue
+        app.extensions["product_group_commit"] = GroupCommitQueue(
+            app,
+            max_batch=app.config["PRODUCT_GROUP_COMMIT_MAX_BATCH"],
+            max_delay_ms=app.config["PRODUCT_GROUP_COMMIT_MAX_DELAY_MS"]
+        )
+    
     
     # from app.api_v1 import api 
     from app.api_v2 import api
     
+    from app.profiling import init_profiling
+    init_profiling(app, api)
+    
     app.register_blueprint(api)
     
+    from app.startup import run_startup, serving_requests
+    if app.config.get("STARTUP_WARMUP") and serving_requests():
+        run_startup(app, started)
     
     return app 
\ No newline at end of file
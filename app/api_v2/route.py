@@ -1,11 +1,77 @@
-from flask import jsonify, request
+import hashlib
+from datetime import datetime, timedelta, timezone
 
-from ..product_service import ProductService
+from flask import jsonify, request, make_response
+
+from ..product_service import ProductService, QUERY_TIMEOUT_ERROR
 
 
 from . import api 
 
 
+def _validators(watermark):
+    """
+    Build the (etag, last_modified) pair for a watermark and the current URL.
+    Last-Modified is rounded up to whole seconds and omitted while the latest
+    change is still within the current second, since a later change in that
+    same second would carry the same date.
+    """
+    last_modified = watermark["last_modified"]
+    stamp = last_modified.isoformat() if last_modified else ""
+    etag = hashlib.sha1(
+        f"{request.full_path}|{watermark['count']}|{stamp}".encode()
+    ).hexdigest()
+    if last_modified:
+        if last_modified.microsecond:
+            last_modified = last_modified.replace(microsecond=0) + timedelta(seconds=1)
+        if last_modified > datetime.utcnow():
+            last_modified = None
+        else:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+def _not_modified(watermark, use_date=True):
+    """
+    Return a 304 response if the client's cached copy is still fresh, else None
+    Args:
+        use_date: Honour If-Modified-Since. List routes pass False because
+            their date cannot see rows leaving the filter set (only the ETag
+            covers the row count)
+    """
+    if not watermark:
+        return None
+    etag, last_modified = _validators(watermark)
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif use_date and request.if_modified_since and last_modified:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    response = make_response("", 304)
+    return _with_validators(response, watermark)
+
+
+def _error_status(error, default=500):
+    """Map a service error message to an HTTP status code"""
+    return 503 if error == QUERY_TIMEOUT_ERROR else default
+
+
+def _with_validators(response, watermark):
+    """Attach ETag/Last-Modified headers to a response"""
+    if watermark:
+        etag, last_modified = _validators(watermark)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+    return response
+
+
 
 @api.route('/product', methods=["POST"])
 def new_product():
@@ -26,20 +92,28 @@ def get_products():
     page = request.args.get('page', default=1, type=int)
     per_page = request.args.get('per_page', default=20, type=int)
     
-    # Validate parameters (basic sanity checks)
-    if page < 1 or per_page < 1 or per_page > 100:
-        return jsonify({
-            "error": "Validation error", 
-            "message": "Invalid pagination parameters"
-        }), 400
+    guardrail_error = ProductService.check_guardrails("all", page, per_page)
+    if guardrail_error:
+        return jsonify(guardrail_error), 422
     
+    watermark, watermark_error = ProductService.get_list_watermark("all")
+    if watermark_error == QUERY_TIMEOUT_ERROR:
+        return jsonify({"error": "Server error", "message": watermark_error}), 503
+    not_modified = _not_modified(watermark, use_date=False)
+    if not_modified:
+        return not_modified
+
     # Delegate all business logic to service
-    result, error = ProductService.get_all_products(page=page, per_page=per_page)
+    result, error = ProductService.get_all_products(
+        page=page, per_page=per_page, total=watermark["count"] if watermark else None
+    )
     
+    if error == QUERY_TIMEOUT_ERROR:
+        return jsonify({"error": "Server error", "message": error}), 503
     if error:
         return jsonify(error), 400 if error.get('error') == "Validation error" else 500
     
-    return jsonify({
+    return _with_validators(jsonify({
         "data": result["products"],
         "meta": {
             "pagination": {
@@ -49,7 +123,7 @@ def get_products():
                 "total_pages": (result["pagination"]["total"] + per_page - 1) // per_page
             }
         }
-    }), 200
+    }), watermark), 200
 
 @api.route('/product/<product_id>', methods=['PATCH'])
 def update_product(product_id):
@@ -66,10 +140,29 @@ def update_product(product_id):
 
 @api.route('/product/<product_id>', methods=["GET"])
 def get_product(product_id):
+    watermark, _ = ProductService.get_product_watermark(product_id)
+    not_modified = _not_modified(watermark)
+    if not_modified:
+        return not_modified
+
     product, error = ProductService.get_product_by_id(product_id)
     if error:
         return jsonify({"error": error}), 404 if error == "Product not found" else 500
-    return jsonify(product), 200
+    return _with_validators(jsonify(product), watermark), 200
+
+@api.route('/product/<product_id>/related', methods=["GET"])
+def get_related_products(product_id):
+    limit = request.args.get('limit', default=10, type=int)
+    if limit < 1 or limit > 50:
+        return jsonify({
+            "error": "Validation error",
+            "message": "limit must be between 1 and 50"
+        }), 400
+
+    products, error = ProductService.get_related_products(product_id, limit)
+    if error:
+        return jsonify({"error": error}), 404 if error == "Product not found" else 500
+    return jsonify(products), 200
 
 @api.route('/product/<id>', methods=["DELETE"])
 def delete_product(id):
@@ -80,6 +173,73 @@ def delete_product(id):
 
     return jsonify(result), 200
 
+@api.route('/product/bulk-delete', methods=['POST'])
+def bulk_delete_products():
+    """Delete many products (by ids, brand_id and/or category_id) in a few statements"""
+    data = request.get_json() or {}
+    ids = data.get('ids')
+
+    if ids is not None and (not isinstance(ids, list) or len(ids) > 10000):
+        return jsonify({
+            "error": "Validation error",
+            "message": "ids must be a list of at most 10000 product ids"
+        }), 400
+
+    result, error = ProductService.delete_products(
+        ids=ids,
+        brand_id=data.get('brand_id'),
+        category_id=data.get('category_id')
+    )
+
+    if error:
+        return jsonify({"error": error}), 400 if error == "No products selected" else 500
+
+    return jsonify(result), 200
+
+@api.route('/product/changes', methods=['GET'])
+def get_product_changes():
+    """Page through the product change feed by sequence number"""
+    since = request.args.get('since', default=0, type=int)
+    limit = request.args.get('limit', default=100, type=int)
+
+    if since < 0 or limit < 1 or limit > 1000:
+        return jsonify({
+            "error": "Validation error",
+            "message": "Invalid since/limit parameters"
+        }), 400
+
+    result, error = ProductService.get_changes(since=since, limit=limit)
+
+    if error:
+        return jsonify({"error": "Server error", "message": error}), 500
+
+    return jsonify({
+        "data": result["changes"],
+        "meta": {
+            "next_since": result["next_since"],
+            "has_more": result["has_more"]
+        }
+    }), 200
+
+@api.route('/product/suggest', methods=['GET'])
+def suggest_products():
+    """Typeahead suggestions for a name prefix"""
+    prefix = (request.args.get('q') or '').strip()
+    limit = request.args.get('limit', default=10, type=int)
+
+    if not prefix or limit < 1 or limit > 50:
+        return jsonify({
+            "error": "Validation error",
+            "message": "q is required and limit must be between 1 and 50"
+        }), 400
+
+    result, error = ProductService.suggest(prefix, limit)
+
+    if error:
+        return jsonify({"error": "Server error", "message": error}), 500
+
+    return jsonify(result), 200
+
 @api.route("/product/category/<string:category_slug>", methods=["GET"])
 def get_products_by_category(category_slug):
     page = int(request.args.get("page", 1))
@@ -91,14 +251,32 @@ def get_products_by_category(category_slug):
     in_stock_param = request.args.get("in_stock")
     in_stock = in_stock_param.lower() == 'true' if isinstance(in_stock_param, str) else None
 
+    guardrail_error = ProductService.check_guardrails("category", page, per_page, search)
+    if guardrail_error:
+        return jsonify(guardrail_error), 422
+
+    watermark, watermark_error = ProductService.get_list_watermark(
+        "category",
+        category_slug=category_slug,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock,
+        search=search
+    )
+    if watermark_error == QUERY_TIMEOUT_ERROR:
+        return jsonify({"error": "Server error", "message": watermark_error}), 503
+    not_modified = _not_modified(watermark, use_date=False)
+    if not_modified:
+        return not_modified
+
     products, error = ProductService.get_products_by_category(
         category_slug, page, per_page, min_price, max_price, in_stock, search
     )
 
     if error:
-        return jsonify({"error": "Server error", "message": error}), 500
+        return jsonify({"error": "Server error", "message": error}), _error_status(error)
 
-    return jsonify(products), 200
+    return _with_validators(jsonify(products), watermark), 200
 
 
 @api.route('/product/brand/<string:brand_id>', methods=['GET'])
@@ -117,6 +295,23 @@ def get_products_by_brand(brand_id):
     sort_by = request.args.get('sort_by', 'created_at')
     sort_order = request.args.get('sort_order', 'desc')
 
+    guardrail_error = ProductService.check_guardrails("brand", page, per_page)
+    if guardrail_error:
+        return jsonify(guardrail_error), 422
+
+    watermark, watermark_error = ProductService.get_list_watermark(
+        "brand",
+        brand_id=brand_id,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock
+    )
+    if watermark_error == QUERY_TIMEOUT_ERROR:
+        return jsonify({"error": "Server error", "message": watermark_error}), 503
+    not_modified = _not_modified(watermark, use_date=False)
+    if not_modified:
+        return not_modified
+
     products, error = ProductService.get_products_by_brand(
         brand_id=brand_id,
         page=page,
@@ -129,8 +324,8 @@ def get_products_by_brand(brand_id):
     )
 
     if error:
-        return jsonify({"error": error}), 404
-    return jsonify(products), 200
+        return jsonify({"error": error}), _error_status(error, 404)
+    return _with_validators(jsonify(products), watermark), 200
 
 
 @api.route('/product/search', methods=["GET"])
@@ -146,6 +341,25 @@ def search_products():
     in_stock_param = request.args.get("in_stock")
     in_stock = in_stock_param.lower() == 'true' if isinstance(in_stock_param, str) else None
 
+    guardrail_error = ProductService.check_guardrails("search", page, per_page, search_term)
+    if guardrail_error:
+        return jsonify(guardrail_error), 422
+
+    watermark, watermark_error = ProductService.get_list_watermark(
+        "search",
+        search_term=search_term,
+        category_id=category_id,
+        brand_id=brand_id,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock
+    )
+    if watermark_error == QUERY_TIMEOUT_ERROR:
+        return jsonify({"error": "Server error", "message": watermark_error}), 503
+    not_modified = _not_modified(watermark, use_date=False)
+    if not_modified:
+        return not_modified
+
     products, error = ProductService.search_products(
         search_term=search_term,
         page=page,
@@ -158,9 +372,9 @@ def search_products():
     )
 
     if error:
-        return jsonify({"error": "Server error", "message": error}), 500
+        return jsonify({"error": "Server error", "message": error}), _error_status(error)
 
-    return jsonify(products), 200
+    return _with_validators(jsonify(products), watermark), 200
 
 
 
@@ -0,0 +1,238 @@
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, the SQL path is used without it
+    np = None
+
+from flask import current_app
+from sqlalchemy import func
+
+from .change_feed import read_changes, settled_position
+from .model import db, Product, ProductVariant
+from .sharding import for_each_shard
+
+
+# Sort keys the snapshot can answer; anything else falls back to SQL
+SORT_COLUMNS = {
+    "created_at": "created_at",
+    "price": "min_price",
+    "min_effective_price": "min_price",
+}
+
+
+class CatalogSnapshot:
+    """
+    Column-oriented, in-memory copy of the fields the hot listings filter on
+    (category, brand, effective price range, total stock, created_at).
+
+    Filtering, sorting and pagination run as vectorized NumPy operations and
+    only the ids of the requested page are returned; the caller loads those
+    rows from the database. The snapshot replays the product change feed when
+    it is older than `max_lag` seconds, so results may lag writes by that much.
+    """
+
+    def __init__(self, max_lag=2.0):
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._last_seq = None
+        self._last_sync = 0.0
+        self._rows = {}          # product id -> row number
+        self._categories = {}    # category id -> code
+        self._brands = {}        # brand id -> code
+        self._size = 0
+        self._columns = self._allocate(0)
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    @staticmethod
+    def _allocate(capacity):
+        return {
+            "id": np.full(capacity, "", dtype=object),
+            "alive": np.zeros(capacity, dtype=bool),
+            "category": np.full(capacity, -1, dtype=np.int32),
+            "brand": np.full(capacity, -1, dtype=np.int32),
+            "min_price": np.full(capacity, np.nan),
+            "max_price": np.full(capacity, np.nan),
+            "stock": np.zeros(capacity, dtype=np.int64),
+            "created_at": np.full(capacity, np.nan),
+        }
+
+    def _code(self, codes, value):
+        if value is None:
+            return -1
+        return codes.setdefault(value, len(codes))
+
+    @staticmethod
+    def _rows_query():
+        stock = db.session.query(
+            ProductVariant.product_id.label("product_id"),
+            func.sum(ProductVariant.stock).label("stock")
+        ).group_by(ProductVariant.product_id).subquery()
+
+        return db.session.query(
+            Product.id,
+            Product.category_id,
+            Product.brand_id,
+            Product.min_effective_price,
+            Product.max_effective_price,
+            Product.created_at,
+            func.coalesce(stock.c.stock, 0)
+        ).outerjoin(stock, stock.c.product_id == Product.id)
+
+    def _write_row(self, row, values):
+        product_id, category_id, brand_id, min_price, max_price, created_at, stock = values
+        columns = self._columns
+        columns["id"][row] = product_id
+        columns["alive"][row] = True
+        columns["category"][row] = self._code(self._categories, category_id)
+        columns["brand"][row] = self._code(self._brands, brand_id)
+        columns["min_price"][row] = np.nan if min_price is None else float(min_price)
+        columns["max_price"][row] = np.nan if max_price is None else float(max_price)
+        columns["stock"][row] = stock or 0
+        columns["created_at"][row] = np.nan if created_at is None else created_at.timestamp()
+
+    def _append(self, values):
+        capacity = len(self._columns["alive"])
+        if self._size == capacity:
+            grown = self._allocate(max(1024, capacity * 2))
+            for name, column in self._columns.items():
+                grown[name][:capacity] = column
+            self._columns = grown
+        row = self._size
+        self._size += 1
+        self._rows[values[0]] = row
+        self._write_row(row, values)
+
+    def _load(self, query):
+        """Rows of `query()` from every shard"""
+        return [row for rows in for_each_shard(query) for row in rows]
+
+    def _build(self):
+        # A separate app context gets its own session and connection, so the
+        # full load is not cut short by the request's statement timeout
+        with current_app.app_context():
+            last_seq = settled_position()
+            rows = self._load(lambda: self._rows_query().all())
+
+        # Everything is loaded; only now replace the columns and the position
+        self._rows, self._size = {}, 0
+        self._columns = self._allocate(max(1024, len(rows)))
+        for values in rows:
+            self._append(values)
+        self._last_seq = last_seq
+
+    def _apply_changes(self):
+        changes, _ = read_changes(self._last_seq)
+        if not changes:
+            return
+
+        changed_ids = {change.product_id for change in changes}
+        rows = self._load(lambda: self._rows_query().filter(Product.id.in_(changed_ids)).all())
+
+        # Products missing from the result were deleted
+        for product_id in changed_ids - {values[0] for values in rows}:
+            row = self._rows.get(product_id)
+            if row is not None:
+                self._columns["alive"][row] = False
+        for values in rows:
+            row = self._rows.get(values[0])
+            if row is None:
+                self._append(values)
+            else:
+                self._write_row(row, values)
+        # Advanced only once the changes are applied, so a failed read is retried
+        self._last_seq = changes[-1].seq
+
+    def prepare(self):
+        """Run the initial full build, if it has not run yet"""
+        with self._lock:
+            if self._last_seq is None:
+                self._build()
+                self._last_sync = time.monotonic()
+
+    def _sync(self):
+        if self._last_seq is not None and time.monotonic() - self._last_sync < self.max_lag:
+            return
+        if self._last_seq is None:
+            self._build()
+        else:
+            self._apply_changes()
+        self._last_sync = time.monotonic()
+
+    def supports_sort(self, sort_by):
+        return sort_by is None or sort_by in SORT_COLUMNS
+
+    def query(self, page=1, per_page=10, category_id=None, brand_id=None, min_price=None,
+              max_price=None, in_stock=None, sort_by=None, sort_order='desc'):
+        """
+        Filter, sort and paginate the snapshot
+        Args:
+            sort_by: None keeps insertion order, otherwise a key of SORT_COLUMNS
+        Returns:
+            Tuple of (ids on the requested page, total matching count)
+        """
+        with self._lock:
+            self._sync()
+            columns = {name: column[:self._size] for name, column in self._columns.items()}
+            mask = columns["alive"].copy()
+
+            if category_id is not None:
+                code = self._categories.get(category_id)
+                if code is None:
+                    return [], 0
+                mask &= columns["category"] == code
+            if brand_id is not None:
+                code = self._brands.get(brand_id)
+                if code is None:
+                    return [], 0
+                mask &= columns["brand"] == code
+            # NaN prices compare False, matching SQL's NULL semantics
+            if min_price is not None:
+                mask &= columns["max_price"] >= float(min_price)
+            if max_price is not None:
+                mask &= columns["min_price"] <= float(max_price)
+            if in_stock:
+                mask &= columns["stock"] > 0
+
+            matches = np.flatnonzero(mask)
+            total = int(matches.size)
+            start = (page - 1) * per_page
+            stop = min(start + per_page, total)
+            if start >= total:
+                return [], total
+
+            if sort_by is None:
+                chosen = matches[start:stop]
+            else:
+                chosen = matches[self._order(columns, matches, SORT_COLUMNS[sort_by], sort_order == 'desc', stop)]
+                chosen = chosen[start:stop]
+
+            return list(columns["id"][chosen]), total
+
+    @staticmethod
+    def _order(columns, matches, column, descending, stop):
+        """
+        Positions in `matches` of its first `stop` rows in SQL order: NULLs
+        first ascending and last descending, as in SQLite, ties by id in the
+        same direction as the sort
+        """
+        # NaN (NULL) as -inf sorts first ascending and, negated, last descending
+        keys = columns[column][matches]
+        keys = np.where(np.isnan(keys), -np.inf, keys)
+        if descending:
+            keys = -keys
+
+        if stop < len(keys):
+            # Only the first `stop` rows need ordering, plus any rows tied with the last of them
+            candidates = np.flatnonzero(keys <= np.partition(keys, stop - 1)[stop - 1])
+        else:
+            candidates = np.arange(len(keys))
+
+        _, id_rank = np.unique(columns["id"][matches[candidates]], return_inverse=True)
+        if descending:
+            id_rank = -id_rank
+        return candidates[np.lexsort((id_rank, keys[candidates]))][:stop]
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from .model import db, ProductChange
+
+
+def _cutoff():
+    grace = timedelta(seconds=current_app.config["PRODUCT_CHANGES_GAP_GRACE_SECONDS"])
+    return datetime.utcnow() - grace
+
+
+def read_changes(since=0, limit=None):
+    """
+    Change feed entries with a sequence number greater than `since`.
+    Sequence numbers are assigned at insert, not at commit, so with
+    concurrent writers a gap may be a transaction that has not committed
+    yet. Entries after a gap younger than PRODUCT_CHANGES_GAP_GRACE_SECONDS
+    are held back until the gap fills or the grace period passes (gaps
+    left by rolled-back transactions never fill).
+    Returns:
+        Tuple of (entries in sequence order, whether more entries are available)
+    """
+    query = ProductChange.query\
+                .filter(ProductChange.seq > since)\
+                .order_by(ProductChange.seq.asc())
+    changes = query.limit(limit + 1).all() if limit else query.all()
+
+    has_more = bool(limit) and len(changes) > limit
+    if limit:
+        changes = changes[:limit]
+
+    cutoff = _cutoff()
+    expected = since + 1
+    for position, change in enumerate(changes):
+        if change.seq != expected and change.changed_at > cutoff:
+            return changes[:position], False
+        expected = change.seq + 1
+    return changes, has_more
+
+
+def settled_position():
+    """
+    Feed position a full rebuild can safely resume from: the last entry older
+    than the grace period. Later entries may sit behind an uncommitted gap, so
+    they are replayed after the rebuild; replaying an entry is harmless since
+    consumers re-read the product's current state.
+    """
+    seq = db.session.query(ProductChange.seq)\
+                .filter(ProductChange.changed_at <= _cutoff())\
+                .order_by(ProductChange.seq.desc())\
+                .limit(1)\
+                .scalar()
+    return seq or 0
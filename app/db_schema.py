@@ -0,0 +1,67 @@
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from .sharding import SHARDED_TABLES, _detached
+
+
+def migrations_directory(app):
+    """Flask-Migrate directory if the project uses Alembic migrations, else None"""
+    migrate = app.extensions.get("migrate")
+    directory = getattr(migrate, "directory", "migrations")
+    return directory if os.path.isdir(directory) else None
+
+
+def sync_schema(app):
+    """
+    Bring a database created with create_all up to the current models without
+    Alembic: create missing tables, add missing columns with ALTER TABLE and
+    create missing indexes. Columns are only ever added, so new columns must
+    be nullable (or have a server default). Shard databases get the sharded
+    tables, the default database the rest.
+    Returns:
+        List of the changes made, e.g. ["added products.min_effective_price"]
+    """
+    from . import db
+
+    router = app.extensions.get("product_shards")
+    if router is None:
+        return _sync_engine(db.engine, db.metadata)
+
+    changes = _sync_engine(db.engine, _detached(db.metadata, set(db.metadata.tables) - SHARDED_TABLES))
+    shard_metadata = _detached(db.metadata, SHARDED_TABLES)
+    for shard, engine in enumerate(router.engines):
+        changes += [f"{change} (shard {shard})" for change in _sync_engine(engine, shard_metadata)]
+    return changes
+
+
+def _sync_engine(engine, metadata):
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    changes = []
+
+    missing_tables = [table for table in metadata.sorted_tables if table.name not in existing]
+    if missing_tables:
+        metadata.create_all(engine, tables=missing_tables)
+        changes += [f"created {table.name}" for table in missing_tables]
+
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                definition = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}")
+                changes.append(f"added {table.name}.{column.name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f"created index {index.name}")
+    return changes
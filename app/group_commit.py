@@ -0,0 +1,66 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitQueue:
+    """
+    Coalesces concurrent product creations into shared transactions.
+
+    Callers block in submit() while a single worker thread drains the queue
+    in batches of up to `max_batch` items, or whatever arrived within
+    `max_delay_ms` of the first item, and commits each batch once via
+    ProductService.create_products_batch.
+    """
+
+    def __init__(self, app, max_batch=50, max_delay_ms=5):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, data, timeout=None):
+        """Queue a product payload and wait for its (product, error, status_code)"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((data, future))
+        return future.result(timeout)
+
+    def _ensure_worker(self):
+        # Started lazily so forking servers start the thread in each worker process
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="product-group-commit", daemon=True
+                )
+                self._worker.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        from .product_service import ProductService
+
+        while True:
+            batch = self._next_batch()
+            try:
+                with self.app.app_context():
+                    results = ProductService.create_products_batch([data for data, _ in batch])
+            except Exception as e:
+                results = [(None, {"error": "Unknown error", "message": str(e)}, 500)] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
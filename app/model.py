@@ -31,17 +31,26 @@ class Product(db.Model):
     category_id = db.Column(db.String, db.ForeignKey('categories.id'), nullable=True)
     brand_id = db.Column(db.String, db.ForeignKey('brands.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Denormalized lowest/highest price across variants (price_override or price),
+    # maintained by ProductService whenever the product or its variants change
+    min_effective_price = db.Column(db.Numeric(10, 2), nullable=True, index=True)
+    max_effective_price = db.Column(db.Numeric(10, 2), nullable=True)
     
     category = db.relationship('Category', back_populates='products')
     brand = db.relationship('Brand', back_populates='products')
     variants = db.relationship('ProductVariant', back_populates='product', cascade="all, delete-orphan")
     images = db.relationship('ProductImage', back_populates='product', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_products_category_min_effective_price', 'category_id', 'min_effective_price'),
+        db.Index('ix_products_brand_min_effective_price', 'brand_id', 'min_effective_price'),
+    )
+
 class ProductVariant(db.Model):
     __tablename__ = "product_variants"
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
     sku = db.Column(db.String(50), nullable=False, unique=True)
     color = db.Column(db.String(50))
     size = db.Column(db.String(20))
@@ -53,8 +62,30 @@ class ProductVariant(db.Model):
 class ProductImage(db.Model):
     __tablename__ = "product_images"
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.String, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
     image_url = db.Column(db.Text, nullable=False)
     alt_text = db.Column(db.String(100), nullable=True)
     
-    product = db.relationship('Product', back_populates='images')
\ No newline at end of file
+    product = db.relationship('Product', back_populates='images')
+
+class ProductChange(db.Model):
+    __tablename__ = "product_changes"
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    product_id = db.Column(db.String, nullable=False, index=True)
+    operation = db.Column(db.String(10), nullable=False)  # create / update / delete
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RelatedProduct(db.Model):
+    __tablename__ = "product_related"
+    product_id = db.Column(db.String, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(db.String, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class JobCheckpoint(db.Model):
+    __tablename__ = "job_checkpoints"
+    name = db.Column(db.String(50), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
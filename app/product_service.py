@@ -1,43 +1,310 @@
+import heapq
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from decimal import Decimal
+from functools import wraps
+from flask import current_app
 from sqlalchemy.exc import SQLAlchemyError,IntegrityError
-from sqlalchemy import or_, func, and_
-from .model import Product, Category, Brand, ProductVariant,ProductImage, db
-from .schema import ProductSchema
+from sqlalchemy import or_, func, and_, literal
+from .model import Product, Category, Brand, ProductVariant,ProductImage, ProductChange, RelatedProduct, db
+from .schema import ProductSchema, ProductChangeSchema
+from .suggest import SuggestIndex
+from .change_feed import read_changes
+from .catalog_snapshot import CatalogSnapshot
+from .sharding import current_shard
+
+
+QUERY_TIMEOUT_ERROR = "Query timed out"
+
+
+@contextmanager
+def _statement_timeout():
+    """
+    Cancel statements running past PRODUCT_QUERY_TIMEOUT_MS.
+    SQLite has no statement timeout, so a progress handler aborts the
+    running statement once the deadline passes; PostgreSQL uses a
+    transaction-scoped statement_timeout instead.
+    Yields the monotonic deadline.
+    """
+    timeout_ms = current_app.config.get("PRODUCT_QUERY_TIMEOUT_MS")
+    if not timeout_ms:
+        yield None
+        return
+
+    deadline = time.monotonic() + timeout_ms / 1000
+    if current_app.extensions.get("product_shards") is not None and current_shard() is None:
+        # Product queries run on the shards, each under its own timeout (see ProductService._scatter)
+        yield deadline
+        return
+
+    connection = db.session.connection(bind_arguments={"mapper": Product.__mapper__})
+    raw_connection = None
+    if connection.dialect.name == "sqlite":
+        raw_connection = connection.connection.driver_connection
+        raw_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+    try:
+        yield deadline
+    finally:
+        if raw_connection is not None:
+            raw_connection.set_progress_handler(None, 0)
+
+
+def _guarded(method):
+    """Run a (result, error) read method under the statement timeout"""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with _statement_timeout() as deadline:
+            result, error = method(*args, **kwargs)
+        if error and deadline is not None and time.monotonic() > deadline:
+            db.session.rollback()
+            return None, QUERY_TIMEOUT_ERROR
+        return result, error
+    return wrapper
+
+
+def _snapshot_prepared(method):
+    """
+    Build the columnar snapshot before a listing method starts its statement
+    timeout: the initial build reads the whole catalog and must not count
+    against (or be cancelled by) the timeout of the request that triggers it
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        snapshot = ProductService._snapshot()
+        if snapshot is not None:
+            try:
+                snapshot.prepare()
+            except SQLAlchemyError:
+                # Left to the listing, which retries the build and reports the error
+                current_app.logger.exception("Catalog snapshot build failed")
+        return method(*args, **kwargs)
+    return wrapper
 
 
 class ProductService:
     @staticmethod
-    def _paginate_query(query, page=None, per_page=None):
+    def check_guardrails(route, page=1, per_page=10, search=None):
+        """
+        Validate request parameters against the configured query guardrails
+        Args:
+            route: Key into PRODUCT_MAX_PER_PAGE ("all", "category", "brand", "search")
+            page: Page number (1-based)
+            per_page: Items per page
+            search: Optional search term; blank means no search filter
+        Returns:
+            Error dictionary, or None if the request is within limits
+        """
+        config = current_app.config
+        max_per_page = config["PRODUCT_MAX_PER_PAGE"].get(route, config["PRODUCT_MAX_PER_PAGE"]["all"])
+        if page < 1 or per_page < 1 or per_page > max_per_page:
+            return {
+                "error": "Validation error",
+                "message": f"Invalid pagination parameters (per_page must be between 1 and {max_per_page})"
+            }
+
+        if search is not None and search.strip():
+            min_length = config["PRODUCT_SEARCH_MIN_LENGTH"]
+            max_length = config["PRODUCT_SEARCH_MAX_LENGTH"]
+            if not min_length <= len(search.strip()) <= max_length:
+                return {
+                    "error": "Validation error",
+                    "message": f"Search term must be between {min_length} and {max_length} characters"
+                }
+        return None
+
+    @staticmethod
+    def _paginate_query(query, page=None, per_page=None, total=None):
         """
         Internal helper for query pagination
         Args:
             query: SQLAlchemy query object
             page: Page number (1-based)
             per_page: Items per page
+            total: Known row count (e.g. from the watermark); skips the COUNT query
         Returns:
             Dictionary with paginated results and metadata
         """
         if page and per_page:
-            paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+            paginated = query.paginate(page=page, per_page=per_page, error_out=False, count=total is None)
             return {
                 "items": paginated.items,
-                "total": paginated.total,
+                "total": paginated.total if total is None else total,
                 "page": paginated.page,
                 "per_page": paginated.per_page
             }
         return {
             "items": query.all(),
-            "total": query.count(),
+            "total": query.count() if total is None else total,
             "page": 1,
             "per_page": None
         }
 
     @staticmethod
-    def get_all_products(page=None, per_page=None):
-        """Get products with optional pagination"""
+    def _shards():
+        """Internal helper returning the product ShardRouter, or None when sharding is off"""
+        return current_app.extensions.get("product_shards")
+
+    @staticmethod
+    def _product_shard(product_id):
+        """Internal helper routing the product tables to the shard owning `product_id`"""
+        shards = ProductService._shards()
+        if shards is None:
+            return nullcontext()
+        return shards.use(shards.shard_for(product_id))
+
+    @staticmethod
+    def _scatter(fn, shards=None):
+        """Internal helper running fn() on every shard in parallel, under the statement timeout"""
+        def run():
+            with _statement_timeout():
+                return fn()
+        return ProductService._shards().scatter(run, shards)
+
+    @staticmethod
+    def _scatter_page(build_query, page=1, per_page=None, sort_column=None, descending=False, count=True):
+        """
+        Internal helper paginating a listing across shards
+        Args:
+            build_query: Callable returning the filtered (unsorted) product query
+            sort_column: Product column to sort by; ties (and None) sort by id
+            count: Whether to count the matching rows; the total is None when False
+        Returns:
+            Tuple of (serialized products on the page, total count)
+        Each shard returns its count and its first page * per_page rows in sort
+        order; the sorted runs are merged and the page is sliced from the result.
+        """
+        limit = page * per_page if per_page else None
+        columns = [sort_column, Product.id] if sort_column is not None else [Product.id]
+
+        def sort_key(product):
+            key = []
+            for column in columns:
+                value = getattr(product, column.key)
+                # NULLs sort first, as in SQLite
+                key.extend((value is not None, value if value is not None else ""))
+            return tuple(key)
+
+        def run():
+            query = build_query()
+            total = query.order_by(None).count() if count else 0
+            ordered = query.order_by(*[column.desc() if descending else column for column in columns])
+            products = ordered.limit(limit).all() if limit else ordered.all()
+            schema = ProductSchema()
+            return total, [(sort_key(product), schema.dump(product)) for product in products]
+
+        results = ProductService._scatter(run)
+        merged = heapq.merge(*[rows for _, rows in results], key=lambda row: row[0], reverse=descending)
+        start = (page - 1) * per_page if per_page else 0
+        page_rows = [product for _, product in merged][start:limit]
+        return page_rows, sum(total for total, _ in results) if count else None
+
+    @staticmethod
+    def _snapshot():
+        """Internal helper returning the columnar catalog snapshot, or None when disabled"""
+        if not current_app.config.get("PRODUCT_COLUMNAR_SNAPSHOT") or not CatalogSnapshot.available():
+            return None
+        snapshot = current_app.extensions.get("product_catalog_snapshot")
+        if snapshot is None:
+            snapshot = CatalogSnapshot(current_app.config["PRODUCT_SNAPSHOT_MAX_LAG_SECONDS"])
+            current_app.extensions["product_catalog_snapshot"] = snapshot
+        return snapshot
+
+    @staticmethod
+    def _dump_ids(ids):
+        """Internal helper loading products by id and serializing them in that order"""
+        shards = ProductService._shards()
+        if shards is None:
+            products = {product.id: product for product in Product.query.filter(Product.id.in_(ids))}
+            # Rows deleted since the snapshot was refreshed are skipped
+            return ProductSchema(many=True).dump([products[i] for i in ids if i in products])
+
+        by_shard = {}
+        for product_id in ids:
+            by_shard.setdefault(shards.shard_for(product_id), []).append(product_id)
+
+        def load():
+            schema = ProductSchema()
+            return {
+                product.id: schema.dump(product)
+                for product in Product.query.filter(Product.id.in_(by_shard[current_shard()]))
+            }
+
+        dumped = {}
+        for products in ProductService._scatter(load, sorted(by_shard)):
+            dumped.update(products)
+        return [dumped[i] for i in ids if i in dumped]
+
+    @staticmethod
+    def _record_change(product_id, operation):
+        """
+        Internal helper that appends a row to the change feed (outbox).
+        Must be called before the commit so the change is written in the
+        same transaction as the product write it describes.
+        """
+        db.session.add(ProductChange(product_id=product_id, operation=operation))
+
+    @staticmethod
+    def _refresh_effective_prices(product):
+        """
+        Internal helper recomputing a product's min/max effective price.
+        A variant's effective price is its price_override, falling back to
+        the product price; a product without variants uses its own price.
+        """
+        base_price = Decimal(str(product.price))
+        prices = [
+            Decimal(str(variant.price_override)) if variant.price_override is not None else base_price
+            for variant in product.variants
+        ] or [base_price]
+        product.min_effective_price = min(prices)
+        product.max_effective_price = max(prices)
+
+    @staticmethod
+    def _search_filter(search):
+        """
+        Internal helper matching `search` as a literal substring of the name or
+        description; LIKE wildcards in the term are escaped so `%` or `_`
+        cannot turn a search into a match-everything scan
+        """
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+        return or_(
+            Product.name.ilike(pattern, escape="\\"),
+            Product.description.ilike(pattern, escape="\\")
+        )
+
+    @staticmethod
+    def _price_range_filter(query, min_price=None, max_price=None):
+        """Internal helper keeping products whose effective price range overlaps [min_price, max_price]"""
+        if min_price is not None:
+            query = query.filter(Product.max_effective_price >= float(min_price))
+        if max_price is not None:
+            query = query.filter(Product.min_effective_price <= float(max_price))
+        return query
+
+    @staticmethod
+    @_guarded
+    def get_all_products(page=None, per_page=None, total=None):
+        """
+        Get products with optional pagination
+        Args:
+            total: Known product count (e.g. the list watermark's); skips counting again
+        """
         try:
+            if ProductService._shards() is not None:
+                products, counted = ProductService._scatter_page(
+                    lambda: Product.query, page or 1, per_page, count=total is None
+                )
+                return {
+                    "products": products,
+                    "pagination": {"total": counted if total is None else total, "page": page or 1, "per_page": per_page}
+                }, None
+
             query = Product.query
-            result = ProductService._paginate_query(query, page, per_page)
+            result = ProductService._paginate_query(query, page, per_page, total)
             return {
                 "products": ProductSchema(many=True).dump(result["items"]),
                 "pagination": {
@@ -122,88 +389,189 @@ class ProductService:
     #         }, 500
     
     @staticmethod
-    def create_product(data):
-        try:
-            schema = ProductSchema()
-            product_data = schema.load(data)
-
-            # Handle or create brand
-            brand = None
-            if "brand" in data:
-                brand_data = data["brand"]
-                brand = Brand.query.filter_by(name=brand_data.get("name")).first()
-                if not brand:
-                    brand = Brand(**brand_data)
-                    db.session.add(brand)
-
-            # Handle or create category
-            category = None
-            if "category" in data:
-                category_data = data["category"]
-                category = Category.query.filter_by(name=category_data.get("name")).first()
-                if not category:
-                    category = Category(**category_data)
-                    db.session.add(category)
-
-            # Create product (use attribute access instead of dict access)
-            product = Product(
-                name=product_data.name,
-                slug=product_data.slug,
-                description=getattr(product_data, 'description', None),
-                price=product_data.price,
-                brand=brand,
-                category=category
-            )
-            db.session.add(product)
-            db.session.flush()  # Generate product_id
-
-            # Add images (if any)
-            for img in data.get('images', []):
-                image = ProductImage(
-                    image_url=img.get('image_url'),
-                    alt_text=img.get('alt_text'),
-                    product=product
-                )
-                db.session.add(image)
+    def _add_product(data, product_id=None):
+        """
+        Internal helper adding a product (with brand, category, images and
+        variants) to the session and flushing it. Does not commit.
+        When sharding, the caller picks `product_id` and enters its shard first.
+        """
+        schema = ProductSchema()
+        product_data = schema.load(data)
 
-            # Add variants (if any)
-            for var in data.get('variants', []):
-                variant = ProductVariant(product=product, **var)
-                db.session.add(variant)
+        # Handle or create brand
+        brand = None
+        if "brand" in data:
+            brand_data = data["brand"]
+            brand = Brand.query.filter_by(name=brand_data.get("name")).first()
+            if not brand:
+                brand = Brand(**brand_data)
+                db.session.add(brand)
 
-            db.session.commit()
+        # Handle or create category
+        category = None
+        if "category" in data:
+            category_data = data["category"]
+            category = Category.query.filter_by(name=category_data.get("name")).first()
+            if not category:
+                category = Category(**category_data)
+                db.session.add(category)
 
-            return schema.dump(product), None, 201
+        # Create product (use attribute access instead of dict access)
+        product = Product(
+            id=product_id or str(uuid.uuid4()),
+            name=product_data.name,
+            slug=product_data.slug,
+            description=getattr(product_data, 'description', None),
+            price=product_data.price,
+            brand=brand,
+            category=category
+        )
+        db.session.add(product)
+        db.session.flush()  # Generate product_id
 
-        except IntegrityError as e:
-            db.session.rollback()
-            return None, {
+        # Add images (if any)
+        for img in data.get('images', []):
+            image = ProductImage(
+                image_url=img.get('image_url'),
+                alt_text=img.get('alt_text'),
+                product=product
+            )
+            db.session.add(image)
+
+        # Add variants (if any)
+        for var in data.get('variants', []):
+            variant = ProductVariant(product=product, **var)
+            db.session.add(variant)
+
+        ProductService._refresh_effective_prices(product)
+        ProductService._record_change(product.id, "create")
+        db.session.flush()
+        return product
+
+    @staticmethod
+    def _create_error(e):
+        """Internal helper mapping a create_product exception to (error, status_code)"""
+        if isinstance(e, IntegrityError):
+            return {
                 "error": "Integrity error",
                 "message": "Duplicate entry or constraint violation. Check brand/category/product uniqueness."
             }, 400
-
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            return None, {
+        if isinstance(e, SQLAlchemyError):
+            return {
                 "error": "Database error",
                 "message": "Unexpected database error occurred."
             }, 500
+        return {
+            "error": "Unknown error",
+            "message": str(e)
+        }, 500
+
+    @staticmethod
+    def create_product(data):
+        # Hand off to the group-commit queue when it is enabled
+        group_commit = current_app.extensions.get("product_group_commit")
+        if group_commit is not None:
+            return group_commit.submit(data)
+
+        try:
+            product_id = str(uuid.uuid4())
+            with ProductService._product_shard(product_id):
+                product = ProductService._add_product(data, product_id)
+                db.session.commit()
+
+                return ProductSchema().dump(product), None, 201
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            error, status_code = ProductService._create_error(e)
+            return None, error, status_code
 
         except Exception as e:
-            return None, {
-                "error": "Unknown error",
-                "message": str(e)
-            }, 500
+            error, status_code = ProductService._create_error(e)
+            return None, error, status_code
+
+    @staticmethod
+    def create_products_batch(items):
+        """
+        Create several products in a single transaction (group commit)
+        Args:
+            items: List of product payloads, as accepted by create_product
+        Returns:
+            List of (product, error, status_code) tuples, one per item. Each item
+            runs in its own savepoint, so a failing item does not affect the others.
+        """
+        results = [None] * len(items)
+        product_ids = [str(uuid.uuid4()) for _ in items]
+
+        # Group items by shard so each shard connection is entered once
+        groups = {}
+        shards = ProductService._shards()
+        for position, product_id in enumerate(product_ids):
+            shard = shards.shard_for(product_id) if shards is not None else None
+            groups.setdefault(shard, []).append(position)
+
+        try:
+            for shard, positions in groups.items():
+                with ProductService._product_shard(product_ids[positions[0]]):
+                    # Join both the global and the product connection to the
+                    # transaction first, so every savepoint covers both
+                    for bind_arguments in (None, {"mapper": Product.__mapper__}):
+                        db.session.connection(bind_arguments=bind_arguments)
+
+                    for position in positions:
+                        try:
+                            with db.session.begin_nested():
+                                product = ProductService._add_product(items[position], product_ids[position])
+                            results[position] = (ProductSchema().dump(product), None, 201)
+                        except Exception as e:
+                            error, status_code = ProductService._create_error(e)
+                            results[position] = (None, error, status_code)
+
+            db.session.commit()
+            return results
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            error, status_code = ProductService._create_error(e)
+            return [(None, error, status_code)] * len(items)
 
-    
     @staticmethod
     def get_product_by_id(product_id):
         """Get a single product by ID"""
         try:
-            product = Product.query.get(product_id)
-            if not product:
-                return None, "Product not found"
-            return ProductSchema().dump(product), None
+            with ProductService._product_shard(product_id):
+                product = Product.query.get(product_id)
+                if not product:
+                    return None, "Product not found"
+                return ProductSchema().dump(product), None
+        except SQLAlchemyError as e:
+            return None, str(e)
+
+    @staticmethod
+    def get_related_products(product_id, limit=10):
+        """Get precomputed related products (see `flask build-related`)"""
+        try:
+            with ProductService._product_shard(product_id):
+                if not db.session.query(Product.id).filter(Product.id == product_id).scalar():
+                    return None, "Product not found"
+
+            if ProductService._shards() is not None:
+                # Related products may live on other shards
+                related_ids = [
+                    related_id for (related_id,) in db.session.query(RelatedProduct.related_id)
+                                                        .filter(RelatedProduct.product_id == product_id)
+                                                        .order_by(RelatedProduct.rank)
+                                                        .limit(limit)
+                ]
+                return ProductService._dump_ids(related_ids), None
+
+            related = Product.query\
+                        .join(RelatedProduct, RelatedProduct.related_id == Product.id)\
+                        .filter(RelatedProduct.product_id == product_id)\
+                        .order_by(RelatedProduct.rank)\
+                        .limit(limit)\
+                        .all()
+            return ProductSchema(many=True).dump(related), None
         except SQLAlchemyError as e:
             return None, str(e)
 
@@ -211,41 +579,46 @@ class ProductService:
     def update_product(product_id, update_data):
         """Update an existing product"""
         try:
-            product = Product.query.get(product_id)
-            if not product:
-                return None, "Product not found"
+            with ProductService._product_shard(product_id):
+                product = Product.query.get(product_id)
+                if not product:
+                    return None, "Product not found"
 
-            # Handle basic fields
-            if 'name' in update_data:
-                product.name = update_data['name']
-            if 'slug' in update_data:
-                product.slug = update_data['slug']
-            if 'description' in update_data:
-                product.description = update_data['description']
-            if 'price' in update_data:
-                product.price = update_data['price']
+                # Handle basic fields
+                if 'name' in update_data:
+                    product.name = update_data['name']
+                if 'slug' in update_data:
+                    product.slug = update_data['slug']
+                if 'description' in update_data:
+                    product.description = update_data['description']
+                if 'price' in update_data:
+                    product.price = update_data['price']
             
-            # Handle relationships - ensure they exist first
-            if 'brand_id' in update_data and update_data['brand_id']:
-                from .model import Brand
-                brand = Brand.query.get(update_data['brand_id'])
-                if not brand:
-                    return None, "Brand not found"
-                product.brand_id = update_data['brand_id']
+                # Handle relationships - ensure they exist first
+                if 'brand_id' in update_data and update_data['brand_id']:
+                    from .model import Brand
+                    brand = Brand.query.get(update_data['brand_id'])
+                    if not brand:
+                        return None, "Brand not found"
+                    product.brand_id = update_data['brand_id']
             
-            if 'category_id' in update_data and update_data['category_id']:
-                from .model import Category
-                category = Category.query.get(update_data['category_id'])
-                if not category:
-                    return None, "Category not found"
-                product.category_id = update_data['category_id']
+                if 'category_id' in update_data and update_data['category_id']:
+                    from .model import Category
+                    category = Category.query.get(update_data['category_id'])
+                    if not category:
+                        return None, "Category not found"
+                    product.category_id = update_data['category_id']
             
-            # Update the timestamp
-            product.updated_at = datetime.utcnow()
+                if 'price' in update_data:
+                    ProductService._refresh_effective_prices(product)
+
+                # Update the timestamp
+                product.updated_at = datetime.utcnow()
             
-            db.session.commit()
+                ProductService._record_change(product.id, "update")
+                db.session.commit()
             
-            return ProductSchema().dump(product), None
+                return ProductSchema().dump(product), None
         except SQLAlchemyError as e:
             db.session.rollback()
             return None, f"Database error: {str(e)}"
@@ -253,23 +626,212 @@ class ProductService:
             db.session.rollback()
             return None, str(e)
 
+    @staticmethod
+    def _delete_products_where(condition):
+        """
+        Internal helper deleting the products matching `condition`, with their
+        variants, images and related-product rows, using set-based DELETEs
+        instead of loading children through the ORM cascade. Does not commit.
+        Returns:
+            Number of products deleted
+        """
+        product_ids = db.select(Product.id).where(condition)
+        deleted_at = datetime.utcnow()
+
+        # Change feed rows first, while the products still exist
+        if ProductService._shards() is None:
+            db.session.execute(
+                db.insert(ProductChange).from_select(
+                    ["product_id", "operation", "changed_at"],
+                    db.select(Product.id, literal("delete"), literal(deleted_at, db.DateTime)).where(condition)
+                )
+            )
+            global_id_sets = [product_ids]
+        else:
+            # The change feed and related products live in the global database,
+            # so the ids have to be resolved on the shard first
+            ids = db.session.scalars(product_ids).all()
+            if ids:
+                db.session.execute(db.insert(ProductChange), [
+                    {"product_id": product_id, "operation": "delete", "changed_at": deleted_at}
+                    for product_id in ids
+                ])
+            global_id_sets = [ids[start:start + 500] for start in range(0, len(ids), 500)]
+
+        for column in (ProductVariant.product_id, ProductImage.product_id):
+            db.session.execute(
+                db.delete(column.class_).where(column.in_(product_ids)),
+                execution_options={"synchronize_session": False}
+            )
+        for id_set in global_id_sets:
+            for column in (RelatedProduct.product_id, RelatedProduct.related_id):
+                db.session.execute(
+                    db.delete(RelatedProduct).where(column.in_(id_set)),
+                    execution_options={"synchronize_session": False}
+                )
+        return db.session.execute(
+            db.delete(Product).where(condition),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+
     @staticmethod
     def delete_product(product_id):
         """Delete a product"""
         try:
-            product = Product.query.get(product_id)
-            if not product:
-                return None, "Product not found"
-            
-            db.session.delete(product)
-            db.session.commit()
+            with ProductService._product_shard(product_id):
+                deleted = ProductService._delete_products_where(Product.id == product_id)
+                if not deleted:
+                    db.session.rollback()
+                    return None, "Product not found"
+
+                db.session.commit()
             return {"message": "Product deleted successfully"}, None
         except SQLAlchemyError as e:
             db.session.rollback()
             return None, str(e)
 
+    @staticmethod
+    def delete_products(ids=None, brand_id=None, category_id=None):
+        """Bulk delete products by id list and/or brand/category (e.g. a discontinued line)"""
+        try:
+            conditions = []
+            if ids:
+                conditions.append(Product.id.in_(ids))
+            if brand_id:
+                conditions.append(Product.brand_id == brand_id)
+            if category_id:
+                conditions.append(Product.category_id == category_id)
+            if not conditions:
+                return None, "No products selected"
+
+            def delete():
+                deleted = ProductService._delete_products_where(and_(*conditions))
+                db.session.commit()
+                return deleted
+
+            if ProductService._shards() is not None:
+                deleted = sum(ProductService._scatter(delete))
+            else:
+                deleted = delete()
+            return {"message": f"{deleted} products deleted", "deleted": deleted}, None
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return None, str(e)
+
+
+    @staticmethod
+    def refresh_effective_prices():
+        """
+        Recompute min/max effective prices for every product with set-based
+        statements. Only products whose range changes are written; they get a
+        new updated_at and a change feed entry, so ETags, the suggest index and
+        the columnar snapshot pick up the new prices.
+        """
+        def refresh():
+            effective_price = func.coalesce(ProductVariant.price_override, Product.price)
+            new_min, new_max = (
+                func.coalesce(
+                    db.select(aggregate(effective_price))
+                        .where(ProductVariant.product_id == Product.id)
+                        .scalar_subquery(),
+                    Product.price
+                )
+                for aggregate in (func.min, func.max)
+            )
+            stale = or_(
+                Product.min_effective_price.is_distinct_from(new_min),
+                Product.max_effective_price.is_distinct_from(new_max)
+            )
+            refreshed_at = datetime.utcnow()
+
+            # Change feed rows first, while `stale` still matches
+            if ProductService._shards() is None:
+                db.session.execute(
+                    db.insert(ProductChange).from_select(
+                        ["product_id", "operation", "changed_at"],
+                        db.select(Product.id, literal("update"), literal(refreshed_at, db.DateTime)).where(stale)
+                    )
+                )
+            else:
+                ids = db.session.scalars(db.select(Product.id).where(stale)).all()
+                if ids:
+                    db.session.execute(db.insert(ProductChange), [
+                        {"product_id": product_id, "operation": "update", "changed_at": refreshed_at}
+                        for product_id in ids
+                    ])
+
+            updated = db.session.execute(
+                db.update(Product).where(stale).values({
+                    Product.min_effective_price: new_min,
+                    Product.max_effective_price: new_max,
+                    Product.updated_at: refreshed_at
+                }),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+            db.session.commit()
+            return updated
+
+        try:
+            if ProductService._shards() is not None:
+                updated = sum(ProductService._scatter(refresh))
+            else:
+                updated = refresh()
+            return {"message": f"Effective prices refreshed for {updated} products", "updated": updated}, None
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return None, str(e)
+
+    @staticmethod
+    def suggest(prefix, limit=10):
+        """Get product, brand and category names starting with a prefix"""
+        try:
+            index = current_app.extensions.get("product_suggest_index")
+            if index is None:
+                index = SuggestIndex(current_app.config["PRODUCT_SUGGEST_REFRESH_SECONDS"])
+                current_app.extensions["product_suggest_index"] = index
+            return index.suggest(prefix, limit), None
+        except SQLAlchemyError as e:
+            return None, str(e)
+
+    @staticmethod
+    def get_changes(since=0, limit=100):
+        """
+        Get change feed entries with a sequence number greater than `since`;
+        entries behind a possibly uncommitted gap are held back (see read_changes)
+        """
+        try:
+            changes, has_more = read_changes(since, limit)
+            return {
+                "changes": ProductChangeSchema(many=True).dump(changes),
+                "next_since": changes[-1].seq if changes else since,
+                "has_more": has_more
+            }, None
+        except SQLAlchemyError as e:
+            return None, str(e)
+
+
+    @staticmethod
+    def _category_query(category, min_price=None, max_price=None, in_stock=None, search=None):
+        """Internal helper building the filtered product query for a category"""
+        query = Product.query.filter_by(category_id=category.id)
+
+        # Apply price filters
+        query = ProductService._price_range_filter(query, min_price, max_price)
+
+        # Convert in_stock to string and check
+        if str(in_stock).lower() == 'true':
+            query = query.join(Product.variants)\
+                        .group_by(Product.id)\
+                        .having(func.sum(ProductVariant.stock) > 0)
+
+        # Search by name or description
+        if search:
+            query = query.filter(ProductService._search_filter(search))
+        return query
 
     @staticmethod
+    @_snapshot_prepared
+    @_guarded
     def get_products_by_category(category_slug, page=1, per_page=10, min_price=None, 
                                 max_price=None, in_stock=None, search=None):
         """Get products by category slug with optional filters"""
@@ -278,31 +840,28 @@ class ProductService:
             if not category:
                 return None, "Category not found"
 
-            query = Product.query.filter_by(category_id=category.id)
-
-            # Apply price filters
-            if min_price is not None:
-                query = query.filter(Product.price >= float(min_price))
-            if max_price is not None:
-                query = query.filter(Product.price <= float(max_price))
-
-            # Convert in_stock to string and check
-            if str(in_stock).lower() == 'true':
-                query = query.join(Product.variants)\
-                            .group_by(Product.id)\
-                            .having(func.sum(ProductVariant.stock) > 0)
-
-            # Search by name or description
-            if search:
-                query = query.filter(
-                    or_(
-                        Product.name.ilike(f"%{search}%"),
-                        Product.description.ilike(f"%{search}%")
-                    )
+            snapshot = ProductService._snapshot()
+            if snapshot is not None and not search:
+                ids, _ = snapshot.query(
+                    page, per_page, category_id=category.id, min_price=min_price,
+                    max_price=max_price, in_stock=str(in_stock).lower() == 'true',
+                    sort_by='created_at', sort_order='desc'
+                )
+                return ProductService._dump_ids(ids), None
+
+            if ProductService._shards() is not None:
+                products, _ = ProductService._scatter_page(
+                    lambda: ProductService._category_query(category, min_price, max_price, in_stock, search),
+                    page, per_page, Product.created_at, descending=True, count=False
                 )
+                return products, None
+
+            query = ProductService._category_query(category, min_price, max_price, in_stock, search)\
+                        .order_by(Product.created_at.desc(), Product.id.desc())
 
             # Paginate result
-            products = query.paginate(page=page, per_page=per_page, error_out=False)
+            # The listing does not return a total, so skip the COUNT query
+            products = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
             schema = ProductSchema(many=True)
             return schema.dump(products.items), None
 
@@ -311,6 +870,21 @@ class ProductService:
 
 
     @staticmethod
+    def _brand_query(brand_id, min_price=None, max_price=None, in_stock=None):
+        """Internal helper building the filtered product query for a brand"""
+        query = Product.query.filter_by(brand_id=brand_id)
+
+        # Apply filters
+        query = ProductService._price_range_filter(query, min_price, max_price)
+        if in_stock:
+            query = query.join(Product.variants)\
+                        .group_by(Product.id)\
+                        .having(db.func.sum(ProductVariant.stock) > 0)
+        return query
+
+    @staticmethod
+    @_snapshot_prepared
+    @_guarded
     def get_products_by_brand(brand_id, page=1, per_page=10, min_price=None, max_price=None, 
                             in_stock=None, sort_by='created_at', sort_order='desc'):
         """Get products by brand ID with filters and sorting"""
@@ -319,85 +893,175 @@ class ProductService:
             if not brand:
                 return None, "Brand not found"
 
-            query = Product.query.filter_by(brand_id=brand_id)
+            snapshot = ProductService._snapshot()
+            if snapshot is not None and snapshot.supports_sort(sort_by):
+                ids, _ = snapshot.query(
+                    page, per_page, brand_id=brand_id, min_price=min_price, max_price=max_price,
+                    in_stock=in_stock, sort_by=sort_by, sort_order=sort_order
+                )
+                return ProductService._dump_ids(ids), None
+
+            # Apply sorting (price sorts on the lowest effective price across variants)
+            if sort_by == 'price':
+                sort_by = 'min_effective_price'
 
-            # Apply filters
-            if min_price is not None:
-                query = query.filter(Product.price >= min_price)
-            if max_price is not None:
-                query = query.filter(Product.price <= max_price)
-            if in_stock:
-                query = query.join(Product.variants)\
-                            .group_by(Product.id)\
-                            .having(db.func.sum(ProductVariant.stock) > 0)
+            if ProductService._shards() is not None:
+                sort_column = getattr(Product, sort_by, None)
+                descending = sort_order == 'desc'
+                if sort_column is None:
+                    sort_column, descending = Product.created_at, True
+                products, _ = ProductService._scatter_page(
+                    lambda: ProductService._brand_query(brand_id, min_price, max_price, in_stock),
+                    page, per_page, sort_column, descending, count=False
+                )
+                return products, None
 
-            # Apply sorting
+            query = ProductService._brand_query(brand_id, min_price, max_price, in_stock)
             sort_column = getattr(Product, sort_by, None)
+            # Ties sort by id, as on the shards and in the snapshot
             if sort_column is not None:
                 if sort_order == 'desc':
-                    sort_column = sort_column.desc()
-                query = query.order_by(sort_column)
+                    query = query.order_by(sort_column.desc(), Product.id.desc())
+                else:
+                    query = query.order_by(sort_column, Product.id)
             else:
                 # Default sorting if invalid column provided
-                query = query.order_by(Product.created_at.desc())
+                query = query.order_by(Product.created_at.desc(), Product.id.desc())
 
-            products = query.paginate(page=page, per_page=per_page, error_out=False)
+            # The listing does not return a total, so skip the COUNT query
+            products = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
             schema = ProductSchema(many=True)
             return schema.dump(products.items), None
         except SQLAlchemyError as e:
             return None, str(e)
 
     @staticmethod
+    def _search_query(search_term, category_id=None, brand_id=None,
+                      min_price=None, max_price=None, in_stock=None):
+        """Internal helper building the filtered product query for a search"""
+        query = Product.query
+
+        # Basic search across name and description
+        if search_term:
+            query = query.filter(ProductService._search_filter(search_term))
+
+        # Additional filters
+        if category_id:
+            query = query.filter_by(category_id=category_id)
+        if brand_id:
+            query = query.filter_by(brand_id=brand_id)
+        query = ProductService._price_range_filter(query, min_price, max_price)
+        if in_stock:
+            query = query.join(Product.variants)\
+                        .group_by(Product.id)\
+                        .having(db.func.sum(ProductVariant.stock) > 0)
+        return query
+
+    @staticmethod
+    @_snapshot_prepared
+    @_guarded
     def search_products(search_term, page=1, per_page=10, category_id=None, brand_id=None,
                        min_price=None, max_price=None, in_stock=None):
         """Search products with various filters"""
         try:
-            query = Product.query
+            snapshot = ProductService._snapshot()
+            if snapshot is not None and not search_term:
+                ids, _ = snapshot.query(
+                    page, per_page, category_id=category_id or None, brand_id=brand_id or None,
+                    min_price=min_price, max_price=max_price, in_stock=in_stock,
+                    sort_by='created_at', sort_order='desc'
+                )
+                return ProductService._dump_ids(ids), None
 
-            # Basic search across name and description
-            if search_term:
-                query = query.filter(
-                    or_(
-                        Product.name.ilike(f'%{search_term}%'),
-                        Product.description.ilike(f'%{search_term}%')
-                    )
+            if ProductService._shards() is not None:
+                products, _ = ProductService._scatter_page(
+                    lambda: ProductService._search_query(
+                        search_term, category_id, brand_id, min_price, max_price, in_stock
+                    ),
+                    page, per_page, Product.created_at, descending=True, count=False
                 )
+                return products, None
 
-            # Additional filters
-            if category_id:
-                query = query.filter_by(category_id=category_id)
-            if brand_id:
-                query = query.filter_by(brand_id=brand_id)
-            if min_price is not None:
-                query = query.filter(Product.price >= min_price)
-            if max_price is not None:
-                query = query.filter(Product.price <= max_price)
-            if in_stock:
-                query = query.join(Product.variants)\
-                            .group_by(Product.id)\
-                            .having(db.func.sum(ProductVariant.stock) > 0)
+            query = ProductService._search_query(
+                search_term, category_id, brand_id, min_price, max_price, in_stock
+            )
 
             # Default sorting by relevance (could be enhanced)
-            query = query.order_by(Product.created_at.desc())
+            query = query.order_by(Product.created_at.desc(), Product.id.desc())
 
-            products = query.paginate(page=page, per_page=per_page, error_out=False)
+            # The listing does not return a total, so skip the COUNT query
+            products = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
             schema = ProductSchema(many=True)
             return schema.dump(products.items), None
         except SQLAlchemyError as e:
             return None, str(e)
 
+    @staticmethod
+    def _watermark(query):
+        """
+        Internal helper computing a cheap change watermark for a filter set
+        Args:
+            query: Filtered (unpaginated) product query
+        Returns:
+            Dictionary with the row count and the latest updated_at
+        """
+        subquery = query.with_entities(
+            Product.id.label("id"),
+            Product.updated_at.label("updated_at")
+        ).order_by(None).subquery()
+        count, last_modified = db.session.query(
+            func.count(subquery.c.id),
+            func.max(subquery.c.updated_at)
+        ).one()
+        return {"count": count, "last_modified": last_modified}
 
+    @staticmethod
+    def get_product_watermark(product_id):
+        """Get the watermark of a single product without loading it"""
+        try:
+            with ProductService._product_shard(product_id):
+                last_modified = db.session.query(Product.updated_at)\
+                                    .filter(Product.id == product_id)\
+                                    .scalar()
+            if last_modified is None:
+                return None, "Product not found"
+            return {"count": 1, "last_modified": last_modified}, None
+        except SQLAlchemyError as e:
+            return None, str(e)
 
+    @staticmethod
+    @_guarded
+    def get_list_watermark(scope, **filters):
+        """
+        Get the watermark of a product listing
+        Args:
+            scope: One of "all", "category", "brand" or "search"
+            filters: Same filter arguments as the matching listing method
+        Returns:
+            Tuple of (watermark, error)
+        """
+        try:
+            if scope == "all":
+                build_query = lambda: Product.query
+            elif scope == "category":
+                category = Category.query.filter_by(slug=filters.pop("category_slug")).first()
+                if not category:
+                    return None, "Category not found"
+                build_query = lambda: ProductService._category_query(category, **filters)
+            elif scope == "brand":
+                build_query = lambda: ProductService._brand_query(**filters)
+            elif scope == "search":
+                build_query = lambda: ProductService._search_query(**filters)
+            else:
+                return None, f"Unknown scope: {scope}"
 
-
-
-
-
-
-
-
-
-
-
-
-
+            if ProductService._shards() is not None:
+                watermarks = ProductService._scatter(lambda: ProductService._watermark(build_query()))
+                stamps = [watermark["last_modified"] for watermark in watermarks if watermark["last_modified"]]
+                return {
+                    "count": sum(watermark["count"] for watermark in watermarks),
+                    "last_modified": max(stamps) if stamps else None
+                }, None
+            return ProductService._watermark(build_query()), None
+        except SQLAlchemyError as e:
+            return None, str(e)
@@ -0,0 +1,184 @@
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Phases reported in Server-Timing, measured as the cumulative time of these
+# functions in the profile: (file path suffix, function name)
+PHASE_FUNCTIONS = {
+    "lazy_load": ("sqlalchemy/orm/strategies.py", "_load_for_state"),
+    "serialize": ("marshmallow/schema.py", "dump"),
+    "jsonify": ("flask/json/__init__.py", "jsonify"),
+}
+
+
+def init_profiling(app, blueprint):
+    """
+    Register the on-demand profiling hooks for requests to `blueprint` when
+    PROFILING_ENABLED is set. The hooks go on the app rather than on the
+    blueprint, which is shared by every app and cannot change once registered.
+    """
+    if not app.config.get("PROFILING_ENABLED"):
+        return
+
+    # Engine events are process-wide; only listen once however many apps are created
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def start_profile():
+        if request.blueprint == blueprint.name:
+            _start_profile()
+
+    app.before_request(start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+
+
+def _should_profile():
+    config = current_app.config
+    token = config.get("PROFILING_ADMIN_TOKEN")
+    provided = request.headers.get(config["PROFILING_ADMIN_HEADER"], "")
+    if token and hmac.compare_digest(provided.encode(), token.encode()):
+        return True
+    return random.random() < config.get("PROFILING_SAMPLE_RATE", 0.0)
+
+
+def _start_profile():
+    if not _should_profile():
+        return
+    g.profile_sql = {"time": 0.0, "count": 0}
+    g.profile_started = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "profiler" in g:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "profiler" in g and conn.info.get("profile_query_start"):
+        g.profile_sql["time"] += time.perf_counter() - conn.info["profile_query_start"].pop()
+        g.profile_sql["count"] += 1
+
+
+def _finish_profile(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    total = time.perf_counter() - g.profile_started
+
+    stats = pstats.Stats(profiler)
+    timings = {"total": total, "sql": g.profile_sql["time"]}
+    for phase, function in PHASE_FUNCTIONS.items():
+        timings[phase] = _cumulative_time(stats, *function)
+
+    profile_id = _write_profile(stats)
+    response.headers["Server-Timing"] = ", ".join(
+        f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.items()
+    )
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["X-Profile-Queries"] = str(g.profile_sql["count"])
+    return response
+
+
+def _discard_profile(exc):
+    # after_request does not run when the view raises
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def _cumulative_time(stats, path_suffix, function_name):
+    total = 0.0
+    for (filename, _, name), (_, _, _, cumulative, _) in stats.stats.items():
+        if name == function_name and filename.replace(os.sep, "/").endswith(path_suffix):
+            total = max(total, cumulative)
+    return total
+
+
+def _write_profile(stats):
+    """Write <id>.pstats and <id>.collapsed, keeping at most PROFILING_MAX_FILES profiles"""
+    directory = current_app.config["PROFILING_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{uuid.uuid4().hex[:8]}"
+    base = os.path.join(directory, profile_id)
+
+    stats.dump_stats(base + ".pstats")
+    with open(base + ".collapsed", "w") as collapsed:
+        for stack, microseconds in _collapsed_stacks(stats):
+            collapsed.write(f"{stack} {microseconds}\n")
+
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".pstats")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:-current_app.config["PROFILING_MAX_FILES"]]:
+        for suffix in (".pstats", ".collapsed"):
+            try:
+                os.remove(entry.path[:-len(".pstats")] + suffix)
+            except FileNotFoundError:
+                pass
+    return profile_id
+
+
+def _label(function):
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _collapsed_stacks(stats, max_depth=64):
+    """
+    Collapsed-stack ("a;b;c <us>") lines for flamegraph tools.
+    cProfile records caller/callee edges rather than full stacks, so each
+    function's self time is split across its call paths in proportion to the
+    cumulative time of the edges leading to it.
+    """
+    callees = defaultdict(list)
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, edge in callers.items():
+            callees[caller].append((function, edge[3]))
+
+    lines = defaultdict(int)
+
+    def walk(function, path, share):
+        own_time = stats.stats[function][2]
+        path = path + [_label(function)]
+        microseconds = int(own_time * share * 1e6)
+        if microseconds:
+            lines[";".join(path)] += microseconds
+        if len(path) >= max_depth:
+            return
+        for callee, edge_cumulative in callees[function]:
+            callee_cumulative = stats.stats[callee][3]
+            if callee in visiting or not callee_cumulative:
+                continue
+            callee_share = share * min(1.0, edge_cumulative / callee_cumulative)
+            # Prune paths under 10us to keep the walk bounded
+            if callee_share * callee_cumulative < 1e-5:
+                continue
+            visiting.add(callee)
+            walk(callee, path, callee_share)
+            visiting.discard(callee)
+
+    for root in roots:
+        visiting = {root}
+        walk(root, [], 1.0)
+    return sorted(lines.items())
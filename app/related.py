@@ -0,0 +1,228 @@
+import math
+import re
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, required only by the related-products job
+    np = None
+
+from .change_feed import read_changes, settled_position
+from .model import db, Product, RelatedProduct, JobCheckpoint
+from .sharding import for_each_shard
+
+
+CHECKPOINT_NAME = "related_products"
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Upper bound on the dense (batch x products) score block, in cells
+MAX_SCORE_CELLS = 20_000_000
+
+
+def _tokens(product):
+    """Terms for a product: words of name and description plus category/brand features"""
+    _, name, description, category_id, brand_id = product
+    terms = TOKEN_RE.findall(f"{name} {description or ''}".lower())
+    features = []
+    if category_id:
+        features.append(f"__category:{category_id}")
+    if brand_id:
+        features.append(f"__brand:{brand_id}")
+    return terms, features
+
+
+def _ranges(starts, ends):
+    """Concatenate arange(start, end) for every pair, vectorized"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(total) + offsets
+
+
+class TfidfMatrix:
+    """
+    L2-normalized TF-IDF vectors held as CSR (rows = products) and CSC
+    (postings per term) NumPy arrays, so a batch of rows can be scored
+    against every product by walking only the postings of their terms.
+    """
+
+    def __init__(self, products, feature_weight=0.5, max_df=0.5):
+        self.ids = [product[0] for product in products]
+        documents = [_tokens(product) for product in products]
+        n = len(documents)
+
+        document_frequency = Counter()
+        for terms, features in documents:
+            document_frequency.update(set(terms) | set(features))
+        # Terms in one document cannot relate two products; very common ones add noise
+        vocabulary = {
+            term: index for index, term in enumerate(
+                term for term, df in document_frequency.items()
+                if df > 1 and (n < 10 or df <= max_df * n)
+            )
+        }
+        idf = {term: math.log((1 + n) / (1 + document_frequency[term])) + 1 for term in vocabulary}
+
+        indptr, indices, data = [0], [], []
+        for terms, features in documents:
+            weights = {}
+            for term, count in Counter(terms).items():
+                if term in vocabulary:
+                    weights[vocabulary[term]] = (1 + math.log(count)) * idf[term]
+            for feature in features:
+                if feature in vocabulary:
+                    weights[vocabulary[feature]] = feature_weight * idf[feature]
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for column, weight in sorted(weights.items()):
+                indices.append(column)
+                data.append(weight / norm)
+            indptr.append(len(indices))
+
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+
+        # Transpose to postings lists
+        row_of = np.repeat(np.arange(n), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        self.posting_rows = row_of[order]
+        self.posting_data = self.data[order]
+        self.posting_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(vocabulary)), out=self.posting_ptr[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def top_k(self, rows, k):
+        """
+        Cosine top-k neighbours for a batch of row numbers
+        Returns:
+            List (one per row) of [(row, score), ...] sorted by score descending
+        """
+        n = len(self)
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # Terms (and weights) of each query row
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        query_pos = _ranges(starts, ends)
+        query_row = np.repeat(np.arange(rows.size), ends - starts)
+        query_term = self.indices[query_pos]
+
+        # Every posting of those terms contributes query_weight * posting_weight
+        posting_starts = self.posting_ptr[query_term]
+        posting_ends = self.posting_ptr[query_term + 1]
+        posting_pos = _ranges(posting_starts, posting_ends)
+        counts = posting_ends - posting_starts
+        weights = np.repeat(self.data[query_pos], counts) * self.posting_data[posting_pos]
+        cells = np.repeat(query_row, counts) * n + self.posting_rows[posting_pos]
+
+        scores = np.bincount(cells, weights=weights, minlength=rows.size * n).reshape(rows.size, n)
+        scores[np.arange(rows.size), rows] = 0.0
+
+        k = min(k, n - 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for batch_row, candidates in enumerate(top):
+            candidate_scores = scores[batch_row, candidates]
+            order = np.argsort(-candidate_scores, kind="stable")
+            results.append([
+                (int(candidates[i]), float(candidate_scores[i]))
+                for i in order if candidate_scores[i] > 0
+            ])
+        return results
+
+
+def build_related_products(full=False, top_k=10, batch_size=256, feature_weight=0.5):
+    """
+    Precompute the top-k related products and store them in product_related.
+    Incremental runs recompute only products changed since the last run
+    (from the change feed), products listing a changed product as a
+    neighbour, and the new neighbours of changed products.
+    Returns:
+        Dictionary of run statistics
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required to build related products")
+
+    checkpoint = JobCheckpoint.query.get(CHECKPOINT_NAME)
+    full = full or checkpoint is None
+
+    # The feed is read before the products, so every change up to the new
+    # checkpoint is reflected in the rows scored below
+    if full:
+        changed = set()
+        last_seq = settled_position()
+    else:
+        changes, _ = read_changes(checkpoint.last_seq)
+        changed = {change.product_id for change in changes}
+        last_seq = changes[-1].seq if changes else checkpoint.last_seq
+
+    products = sorted(
+        row for rows in for_each_shard(
+            lambda: db.session.query(
+                Product.id, Product.name, Product.description, Product.category_id, Product.brand_id
+            ).all()
+        )
+        for row in rows
+    )
+    matrix = TfidfMatrix(products, feature_weight=feature_weight)
+    row_of = {product_id: row for row, product_id in enumerate(matrix.ids)}
+
+    if full:
+        targets = set(range(len(matrix)))
+        removed = set()
+    else:
+        removed = {product_id for product_id in changed if product_id not in row_of}
+        referencing = {
+            product_id for (product_id,) in db.session.query(RelatedProduct.product_id)
+                                               .filter(RelatedProduct.related_id.in_(changed))
+                                               .distinct()
+        } if changed else set()
+        targets = {row_of[product_id] for product_id in (changed | referencing) if product_id in row_of}
+
+    neighbours = {}
+    pending = sorted(targets)
+    expanded = full
+    batch_size = max(1, min(batch_size, MAX_SCORE_CELLS // max(len(matrix), 1)))
+    while pending and len(matrix) > 1:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            for row, result in zip(batch, matrix.top_k(batch, top_k)):
+                neighbours[row] = result
+        if expanded:
+            break
+        # Products that now rank a changed product highly may need it in their own list
+        expanded = True
+        pending = sorted({other for result in neighbours.values() for other, _ in result} - neighbours.keys())
+
+    if full:
+        RelatedProduct.query.delete(synchronize_session=False)
+    else:
+        stale = removed | {matrix.ids[row] for row in neighbours}
+        if stale:
+            RelatedProduct.query.filter(RelatedProduct.product_id.in_(stale)).delete(synchronize_session=False)
+        if removed:
+            RelatedProduct.query.filter(RelatedProduct.related_id.in_(removed)).delete(synchronize_session=False)
+
+    rows = [
+        {
+            "product_id": matrix.ids[row],
+            "rank": rank,
+            "related_id": matrix.ids[other],
+            "score": score
+        }
+        for row, result in neighbours.items()
+        for rank, (other, score) in enumerate(result)
+    ]
+    if rows:
+        db.session.execute(db.insert(RelatedProduct), rows)
+
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=CHECKPOINT_NAME)
+        db.session.add(checkpoint)
+    checkpoint.last_seq = last_seq
+    db.session.commit()
+
+    return {"products": len(matrix), "updated": len(neighbours), "full": full}
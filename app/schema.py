@@ -1,6 +1,6 @@
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, auto_field
 from marshmallow import fields, validate, validates, ValidationError
-from .model import Product, ProductImage, Brand, Category, ProductVariant
+from .model import Product, ProductImage, Brand, Category, ProductVariant, ProductChange
 from . import db
 
 
@@ -77,6 +77,8 @@ class ProductSchema(SQLAlchemyAutoSchema):
     slug = auto_field(required=True, validate=validate.Length(max=100))
     description = auto_field(required=True)
     price = auto_field(required=True)
+    min_effective_price = auto_field(dump_only=True)
+    max_effective_price = auto_field(dump_only=True)
     category_id = auto_field(required=False)  # Nullable
     brand_id = auto_field(required=False)  # Nullable
 
@@ -84,4 +86,10 @@ class ProductSchema(SQLAlchemyAutoSchema):
     brand = fields.Nested(BrandSchema, required=False)
     category = fields.Nested(CategorySchema, required=False)
     variants = fields.List(fields.Nested(ProductVariantSchema), required=False)
-    images = fields.List(fields.Nested(ProductImageSchema), required=False)
\ No newline at end of file
+    images = fields.List(fields.Nested(ProductImageSchema), required=False)
+
+class ProductChangeSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = ProductChange
+        load_instance = True
+        sqla_session = db.session
@@ -0,0 +1,123 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, create_engine
+from sqlalchemy.sql.util import find_tables
+
+
+# Tables split across the shard databases; everything else stays in the
+# default (global) database
+SHARDED_TABLES = frozenset({"products", "product_variants", "product_images"})
+
+_current_shard = ContextVar("product_shard", default=None)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+class ShardedSession(Session):
+    """
+    Session routing the sharded product tables to the engine of the shard
+    selected with ShardRouter.use(). Other tables use the normal binds.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        router = current_app.extensions.get("product_shards")
+        if router is not None and bind is None and _is_sharded(mapper, clause):
+            shard = _current_shard.get()
+            if shard is None:
+                raise RuntimeError("Sharded product tables accessed outside of a shard context")
+            return router.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_sharded(mapper, clause):
+    if mapper is not None:
+        return mapper.local_table.name in SHARDED_TABLES
+    if clause is not None:
+        tables = find_tables(clause, include_aliases=True, include_joins=True, include_crud=True)
+        return any(getattr(table, "name", None) in SHARDED_TABLES for table in tables)
+    return False
+
+
+class ShardRouter:
+    """
+    Horizontal sharding of products, variants and images across the
+    databases listed in PRODUCT_SHARDS, keyed by a hash of the product id.
+    Brands, categories and bookkeeping tables stay in the default database.
+    """
+
+    def __init__(self, app, uris, max_workers=None):
+        self.app = app
+        self.engines = [create_engine(uri) for uri in uris]
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.engines), thread_name_prefix="product-shard"
+        )
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for(self, product_id):
+        return zlib.crc32(str(product_id).encode()) % len(self.engines)
+
+    @contextmanager
+    def use(self, shard):
+        """Route sharded tables to `shard` for the duration of the block"""
+        token = _current_shard.set(shard)
+        try:
+            yield shard
+        finally:
+            _current_shard.reset(token)
+
+    def scatter(self, fn, shards=None):
+        """
+        Run `fn()` once per shard in parallel, each in its own app context
+        (and therefore its own session) routed to that shard.
+        Returns the results in shard order; the first exception is re-raised.
+        """
+        def run(shard):
+            with self.app.app_context(), self.use(shard):
+                return fn()
+
+        shards = range(len(self.engines)) if shards is None else shards
+        return list(self._executor.map(run, shards))
+
+    def create_all(self, metadata, global_engine):
+        """
+        Create the sharded tables in every shard database and the remaining
+        tables in the global database. Foreign keys between the two sides
+        are left out of the DDL since they would reference tables in another
+        database; the model metadata keeps them for relationship joins.
+        """
+        global_names = set(metadata.tables) - SHARDED_TABLES
+        _detached(metadata, global_names).create_all(global_engine)
+        shard_metadata = _detached(metadata, SHARDED_TABLES)
+        for engine in self.engines:
+            shard_metadata.create_all(engine)
+
+
+def _detached(metadata, names):
+    """Copy of the `names` tables without foreign keys to tables outside `names`"""
+    target = MetaData()
+    for name in names:
+        table = metadata.tables[name].to_metadata(target)
+        for constraint in list(table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] not in names:
+                table.constraints.discard(constraint)
+                for element in constraint.elements:
+                    table.foreign_keys.discard(element)
+                    element.parent.foreign_keys.discard(element)
+    return target
+
+
+def for_each_shard(fn):
+    """Run `fn()` on every shard (or once, unsharded) and return the list of results"""
+    router = current_app.extensions.get("product_shards")
+    if router is None:
+        return [fn()]
+    return router.scatter(fn)
@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import click
+from sqlalchemy.orm import configure_mappers
+
+from .db_schema import migrations_directory, sync_schema
+
+
+class StartupTimer:
+    """Wall-clock breakdown of the startup phases, in seconds"""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = {}
+
+    def phase(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def report(self):
+        return {**self.phases, "total": time.perf_counter() - self.started}
+
+
+def serving_requests():
+    """
+    Whether the app is being created to serve requests. The `flask` CLI
+    (migrations, maintenance commands, shell) loads the app too, and must
+    keep working on a database the warmup cannot use yet; `flask run` serves.
+    """
+    if os.environ.get("FLASK_RUN_FROM_CLI") != "true":
+        return True
+    context = click.get_current_context(silent=True)
+    return context is not None and context.command.name == "run"
+
+
+def run_startup(app, started=None):
+    """
+    Warm a freshly created app before it serves traffic: configure the ORM
+    mappers, build the serializers, bring the schema up to date when the
+    project has no migrations, open the connection pool and compile the hot
+    ProductService queries.
+    The warmup is an optimization, so a failing phase is logged and the rest
+    are skipped rather than failing create_app; its name is stored in
+    app.extensions["startup_failed_phase"].
+    The timing breakdown is stored in app.extensions["startup_timings"].
+    """
+    timer = StartupTimer(started)
+    if started is not None:
+        timer.phases["create_app"] = time.perf_counter() - started
+
+    phases = [
+        ("mappers", configure_mappers),
+        ("serializers", _warm_serializers),
+        ("schema", _ensure_schema, app),
+        ("pool", _warm_pool, app),
+        ("statements", _warm_statements),
+    ]
+    with app.app_context():
+        for name, fn, *args in phases:
+            try:
+                timer.phase(name, fn, *args)
+            except Exception:
+                app.logger.exception("Startup phase %s failed, skipping the rest of the warmup", name)
+                app.extensions["startup_failed_phase"] = name
+                break
+
+    timings = timer.report()
+    app.extensions["startup_timings"] = timings
+    summary = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items())
+    budget = app.config.get("STARTUP_BUDGET_SECONDS")
+    if budget and timings["total"] > budget:
+        app.logger.warning("Startup over budget (%.2fs > %.2fs): %s", timings["total"], budget, summary)
+    else:
+        app.logger.info("Startup: %s", summary)
+    return timings
+
+
+def _warm_serializers():
+    """Instantiate every schema and dump a transient product so nested fields are bound"""
+    from .model import Product, Brand, Category, ProductVariant, ProductImage
+    from . import schema
+
+    for value in vars(schema).values():
+        if isinstance(value, type) and issubclass(value, schema.SQLAlchemyAutoSchema) \
+                and value is not schema.SQLAlchemyAutoSchema:
+            value()
+            value(many=True)
+
+    now = datetime.utcnow()
+    product = Product(
+        name="warmup", slug="warmup", description="", price=Decimal("0"),
+        min_effective_price=Decimal("0"), max_effective_price=Decimal("0"),
+        created_at=now, updated_at=now,
+        brand=Brand(name="warmup"),
+        category=Category(name="warmup", slug="warmup"),
+        variants=[ProductVariant(sku="warmup", stock=0, price_override=Decimal("0"))],
+        images=[ProductImage(image_url="warmup")]
+    )
+    schema.ProductSchema(many=True).dump([product])
+
+
+def _ensure_schema(app):
+    """
+    With a migrations directory, check the database is at the Alembic head
+    (otherwise it is left to `flask db upgrade`); without one, create missing
+    tables, columns and indexes (see db_schema.sync_schema).
+    Returns:
+        "current", "behind" or "updated"
+    """
+    from . import db
+
+    directory = migrations_directory(app)
+    if directory is not None:
+        from alembic.migration import MigrationContext
+        from alembic.script import ScriptDirectory
+
+        heads = set(ScriptDirectory(directory).get_heads())
+        with db.engine.connect() as connection:
+            current = set(MigrationContext.configure(connection).get_current_heads())
+        if current != heads:
+            app.logger.warning("Database is not at the migration head, run `flask db upgrade`")
+            return "behind"
+        return "current"
+
+    changes = sync_schema(app)
+    if not changes:
+        return "current"
+    app.logger.info("Schema updated: %s", ", ".join(changes))
+    return "updated"
+
+
+def _warm_pool(app):
+    """Open up to STARTUP_POOL_CONNECTIONS connections per engine and return them to the pool"""
+    from . import db
+
+    engines = [db.engine]
+    router = app.extensions.get("product_shards")
+    if router is not None:
+        engines += router.engines
+
+    for engine in engines:
+        size = min(app.config.get("STARTUP_POOL_CONNECTIONS", 1), _pool_size(engine))
+        connections = [engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
+
+
+def _pool_size(engine):
+    size = getattr(engine.pool, "size", None)
+    return size() if callable(size) else 1
+
+
+def _warm_statements():
+    """
+    Run the hot read paths once against an id/slug that does not exist so
+    SQLAlchemy's compiled statement cache (and the driver's statement cache
+    on the pooled connections) is populated before the first request.
+    Only statements answered from an index are run: the unfiltered and
+    search listings would scan the products table on every start.
+    """
+    from . import db
+    from .model import Brand, Category, Product
+    from .product_service import ProductService
+    from .sharding import for_each_shard
+
+    missing = str(uuid.uuid4())
+
+    def listings():
+        # Built directly with placeholder ids: the listing methods return
+        # early for an unknown category or brand (and would first build the
+        # columnar snapshot when it is enabled)
+        category = Category(id=missing)
+        for in_stock in (None, True):
+            category_query = ProductService._category_query(category, in_stock=in_stock)
+            category_query.order_by(Product.created_at.desc(), Product.id.desc())\
+                          .paginate(page=1, per_page=1, error_out=False, count=False)
+            ProductService._watermark(category_query)
+
+            brand_query = ProductService._brand_query(missing, in_stock=in_stock)
+            for order in ((Product.created_at.desc(), Product.id.desc()), (Product.min_effective_price, Product.id)):
+                brand_query.order_by(*order).paginate(page=1, per_page=1, error_out=False, count=False)
+            ProductService._watermark(brand_query)
+
+    try:
+        ProductService.get_product_by_id(missing)
+        ProductService.get_product_watermark(missing)
+        ProductService.get_related_products(missing)
+        Category.query.filter_by(slug=missing).first()
+        db.session.get(Brand, missing)
+        for_each_shard(listings)
+        ProductService.get_changes(since=0, limit=1)
+    finally:
+        db.session.remove()
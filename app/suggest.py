@@ -0,0 +1,141 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from .model import db, Product, Brand, Category
+from .change_feed import read_changes, settled_position
+from .sharding import for_each_shard
+
+
+class PrefixIndex:
+    """
+    Sorted in-memory prefix index over (name, id) pairs.
+    Keys are case-folded names, kept in a sorted list so a prefix lookup is
+    a binary search followed by a scan over at most `limit` matches.
+    """
+
+    def __init__(self):
+        self._keys = []     # sorted list of (folded_name, id)
+        self._names = {}    # id -> (folded_name, display name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, pairs):
+        """Replace the index contents with (id, name) pairs, sorting once"""
+        self._names = {item_id: (name.casefold(), name) for item_id, name in pairs}
+        self._keys = sorted((folded, item_id) for item_id, (folded, _) in self._names.items())
+
+    def add(self, item_id, name):
+        if item_id in self._names:
+            if self._names[item_id][1] == name:
+                return
+            self.remove(item_id)
+        folded = name.casefold()
+        self._names[item_id] = (folded, name)
+        insort(self._keys, (folded, item_id))
+
+    def remove(self, item_id):
+        entry = self._names.pop(item_id, None)
+        if entry is None:
+            return
+        position = bisect_left(self._keys, (entry[0], item_id))
+        if position < len(self._keys) and self._keys[position] == (entry[0], item_id):
+            del self._keys[position]
+
+    def search(self, prefix, limit=10):
+        """Return up to `limit` distinct display names starting with `prefix`"""
+        prefix = prefix.casefold()
+        results = []
+        position = bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and len(results) < limit:
+            folded, item_id = self._keys[position]
+            if not folded.startswith(prefix):
+                break
+            name = self._names[item_id][1]
+            if name not in results:
+                results.append(name)
+            position += 1
+        return results
+
+
+class SuggestIndex:
+    """
+    Product, brand and category prefix indexes for typeahead.
+    Built once from the database, then kept current by replaying the
+    product change feed (ProductChange) at most every `refresh_interval`
+    seconds, so writes made by other worker processes are picked up too.
+    """
+
+    def __init__(self, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self.products = PrefixIndex()
+        self.brands = PrefixIndex()
+        self.categories = PrefixIndex()
+        self._last_seq = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def suggest(self, prefix, limit=10):
+        self._sync()
+        with self._lock:
+            return {
+                "products": self.products.search(prefix, limit),
+                "brands": self.brands.search(prefix, limit),
+                "categories": self.categories.search(prefix, limit)
+            }
+
+    def _sync(self):
+        if time.monotonic() - self._last_sync < self.refresh_interval:
+            return
+        with self._lock:
+            if self._last_seq is None:
+                self._build()
+            else:
+                self._apply_changes()
+            self._last_sync = time.monotonic()
+
+    def _build(self):
+        # Everything is loaded before any state changes, so a failed build
+        # leaves the index unbuilt and the next call retries
+        last_seq = settled_position()
+        products, brands, categories = PrefixIndex(), PrefixIndex(), PrefixIndex()
+        products.load(
+            row for rows in for_each_shard(lambda: db.session.query(Product.id, Product.name).all())
+            for row in rows
+        )
+        brands.load(db.session.query(Brand.id, Brand.name))
+        categories.load(db.session.query(Category.id, Category.name))
+        self.products, self.brands, self.categories = products, brands, categories
+        self._last_seq = last_seq
+
+    def _apply_changes(self):
+        changes, _ = read_changes(self._last_seq)
+        if not changes:
+            return
+
+        changed_ids = {change.product_id for change in changes}
+        # Products may live on shards while brands and categories are global,
+        # so they are looked up separately instead of joined
+        rows = [
+            row for rows in for_each_shard(
+                lambda: db.session.query(Product.id, Product.name, Product.brand_id, Product.category_id)
+                            .filter(Product.id.in_(changed_ids))
+                            .all()
+            )
+            for row in rows
+        ]
+        brands = dict(db.session.query(Brand.id, Brand.name).filter(Brand.id.in_({row[2] for row in rows})))
+        categories = dict(db.session.query(Category.id, Category.name).filter(Category.id.in_({row[3] for row in rows})))
+
+        # All reads succeeded; apply them and only then advance the position
+        # Products missing from the result were deleted
+        for product_id in changed_ids - {row[0] for row in rows}:
+            self.products.remove(product_id)
+        for product_id, name, brand_id, category_id in rows:
+            self.products.add(product_id, name)
+            if brand_id in brands:
+                self.brands.add(brand_id, brands[brand_id])
+            if category_id in categories:
+                self.categories.add(category_id, categories[category_id])
+        self._last_seq = changes[-1].seq
@@ -11,6 +11,50 @@ Base_Dir = os.path.abspath(os.path.dirname(__file__))
 class Config:
     DEBUG = True
     SECRET_KEY=os.environ.get('SECRET_KEY') or "somethingveryhard"
+
+    # Query guardrails enforced by ProductService
+    PRODUCT_MAX_PER_PAGE = {"all": 100, "category": 50, "brand": 50, "search": 50}
+    PRODUCT_SEARCH_MIN_LENGTH = 2
+    PRODUCT_SEARCH_MAX_LENGTH = 100
+    PRODUCT_QUERY_TIMEOUT_MS = int(os.environ.get('PRODUCT_QUERY_TIMEOUT_MS', 2000))
+
+    # Change feed: how long a gap in sequence numbers is treated as an
+    # uncommitted write before the entries after it are returned; must exceed
+    # the longest product write transaction
+    PRODUCT_CHANGES_GAP_GRACE_SECONDS = float(os.environ.get('PRODUCT_CHANGES_GAP_GRACE_SECONDS', 5.0))
+
+    # Horizontal sharding of products/variants/images by product id hash:
+    # comma-separated database URIs, empty to keep everything in one database.
+    # Foreign keys between shard and global tables are not created, and SKU
+    # uniqueness is only enforced within a shard
+    PRODUCT_SHARDS = [uri for uri in os.environ.get('PRODUCT_SHARDS', '').split(',') if uri]
+
+    # Group commit for POST /product (batches concurrent creates into one transaction)
+    PRODUCT_GROUP_COMMIT = os.environ.get('PRODUCT_GROUP_COMMIT', '').lower() == 'true'
+    PRODUCT_GROUP_COMMIT_MAX_BATCH = 50
+    PRODUCT_GROUP_COMMIT_MAX_DELAY_MS = 5
+
+    # Typeahead index: how often (seconds) to replay the change feed into it
+    PRODUCT_SUGGEST_REFRESH_SECONDS = 1.0
+
+    # Columnar (NumPy) read model for the category/brand/search listings
+    PRODUCT_COLUMNAR_SNAPSHOT = os.environ.get('PRODUCT_COLUMNAR_SNAPSHOT', '').lower() == 'true'
+    PRODUCT_SNAPSHOT_MAX_LAG_SECONDS = 2.0
+
+    # On-demand request profiling for the api blueprint
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() == 'true'
+    PROFILING_ADMIN_HEADER = "X-Profile-Token"
+    PROFILING_ADMIN_TOKEN = os.environ.get('PROFILING_ADMIN_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))
+    PROFILING_DIR = os.environ.get('PROFILING_DIR') or os.path.join(Base_Dir, "profiles")
+    PROFILING_MAX_FILES = 50
+
+    # Startup pipeline run by create_app when serving, not for `flask` CLI
+    # commands (mapper/serializer/pool/query warmup, missing tables and columns
+    # added when there are no migrations); `flask startup-report` checks the budget
+    STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'true').lower() == 'true'
+    STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 2.0))
+    STARTUP_POOL_CONNECTIONS = int(os.environ.get('STARTUP_POOL_CONNECTIONS', 2))
     
     @staticmethod
     def init_app(app):
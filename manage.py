@@ -1,4 +1,6 @@
 import os 
+import timeit
+import click
 from flask_migrate import Migrate 
 from app import create_app, db 
 
@@ -13,4 +15,88 @@ migrate=Migrate(app, db)
 
 @app.shell_context_processor
 def make_shell_context():
-    return {"db": db}
\ No newline at end of file
+    return {"db": db}
+
+@app.cli.command("refresh-prices")
+def refresh_prices():
+    """Backfill min/max effective prices for all products."""
+    from app.db_schema import migrations_directory, sync_schema
+    from app.product_service import ProductService
+
+    # Databases created with create_all predate the price columns
+    if migrations_directory(app) is None:
+        for change in sync_schema(app):
+            print(f"Schema: {change}")
+
+    result, error = ProductService.refresh_effective_prices()
+    print(error or result["message"])
+
+
+
+@app.cli.command("bench-listings")
+@click.option("--iterations", default=50, show_default=True)
+def bench_listings(iterations):
+    """Compare the hot listings on the SQL path and the columnar snapshot."""
+    from app.model import Brand, Category
+    from app.product_service import ProductService
+
+    category = Category.query.first()
+    brand = Brand.query.first()
+    if not category or not brand:
+        print("Need at least one category and brand to benchmark")
+        return
+
+    cases = {
+        "category": lambda: ProductService.get_products_by_category(category.slug),
+        "category in_stock price<=100": lambda: ProductService.get_products_by_category(
+            category.slug, max_price=100, in_stock=True),
+        "brand sort_by=price": lambda: ProductService.get_products_by_brand(
+            brand.id, sort_by="price", sort_order="asc"),
+        "search in_stock page 5": lambda: ProductService.search_products(
+            None, page=5, in_stock=True),
+    }
+
+    snapshot_setting = app.config["PRODUCT_COLUMNAR_SNAPSHOT"]
+    for name, run in cases.items():
+        timings = {}
+        for enabled in (False, True):
+            app.config["PRODUCT_COLUMNAR_SNAPSHOT"] = enabled
+            run()  # warm up (builds the snapshot on first use)
+            timings[enabled] = timeit.timeit(run, number=iterations) / iterations * 1000
+        print(f"{name:<30} sql {timings[False]:8.2f} ms   snapshot {timings[True]:8.2f} ms")
+    app.config["PRODUCT_COLUMNAR_SNAPSHOT"] = snapshot_setting
+
+
+
+@app.cli.command("build-related")
+@click.option("--full", is_flag=True, help="Rebuild every product instead of only changed ones.")
+@click.option("--top-k", default=10, show_default=True)
+@click.option("--batch-size", default=256, show_default=True)
+def build_related(full, top_k, batch_size):
+    """Precompute related products from TF-IDF over name, description, category and brand."""
+    from app.related import build_related_products
+
+    stats = build_related_products(full=full, top_k=top_k, batch_size=batch_size)
+    print(f"{'Rebuilt' if stats['full'] else 'Updated'} related products for "
+          f"{stats['updated']} of {stats['products']} products")
+
+
+
+@app.cli.command("startup-report")
+def startup_report():
+    """Print the startup timing breakdown; exits non-zero when over STARTUP_BUDGET_SECONDS."""
+    # create_app skips the pipeline for CLI commands, so run it here
+    from app.startup import run_startup
+    timings = run_startup(app)
+    for phase, seconds in timings.items():
+        print(f"{phase:<12} {seconds * 1000:8.1f} ms")
+
+    failed = app.extensions.get("startup_failed_phase")
+    if failed:
+        print(f"Startup phase {failed} failed")
+        raise SystemExit(1)
+
+    budget = app.config["STARTUP_BUDGET_SECONDS"]
+    if timings["total"] > budget:
+        print(f"Startup took {timings['total']:.2f}s, over the {budget:.2f}s budget")
+        raise SystemExit(1)
@@ -4,6 +4,7 @@ import os
 
 
 from app import create_app, db 
+from app.db_schema import migrations_directory, sync_schema
 
 
 port = int(os.getenv("PORT", 5000))
@@ -14,5 +15,7 @@ app = create_app(os.getenv('FLASK_ENV', "default"))
 
 
 with app.app_context():
-    db.create_all()
+    # Tables are created by the startup pipeline in create_app when missing
+    if not app.config["STARTUP_WARMUP"] and migrations_directory(app) is None:
+        sync_schema(app)
     app.run(port=port)
\ No newline at end of file
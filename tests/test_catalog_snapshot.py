@@ -0,0 +1,119 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.catalog_snapshot import CatalogSnapshot
+from app.model import Brand, Product
+from config import TestingDeveloping
+
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'snapshot.db'}")
+    monkeypatch.setattr(TestingDeveloping, "PRODUCT_COLUMNAR_SNAPSHOT", True)
+    monkeypatch.setattr(TestingDeveloping, "PRODUCT_SNAPSHOT_MAX_LAG_SECONDS", 0)
+    app = create_app("testing")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_product(client, i):
+    response = client.post("/product", json={
+        "name": f"Product {i}",
+        "slug": f"p{i}",
+        "description": f"description {i}",
+        "price": 100 + (i * 7) % 23,
+        "brand": {"name": f"B{i % 2}"},
+        "category": {"name": f"C{i % 3}", "slug": f"c{i % 3}"},
+        "variants": [{"sku": f"sku-{i}", "stock": i % 4}]
+    })
+    assert response.status_code == 201, response.json
+    return response
+
+
+def listings(app):
+    with app.app_context():
+        brand_id = Brand.query.filter_by(name="B1").one().id
+    return [
+        "/product/category/c1?per_page=50",
+        "/product/category/c2?in_stock=true&min_price=105&per_page=50",
+        f"/product/brand/{brand_id}?sort_by=price&sort_order=asc&per_page=50",
+        f"/product/brand/{brand_id}?sort_by=price&sort_order=desc&per_page=3&page=2",
+        "/product/search?in_stock=true&per_page=50",
+        "/product/search?max_price=110&per_page=5&page=2",
+    ]
+
+
+def slugs(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.json
+    return [product["slug"] for product in response.json]
+
+
+def assert_matches_sql(app, client):
+    for url in listings(app):
+        app.config["PRODUCT_COLUMNAR_SNAPSHOT"] = True
+        from_snapshot = slugs(client, url)
+        app.config["PRODUCT_COLUMNAR_SNAPSHOT"] = False
+        from_sql = slugs(client, url)
+        assert from_snapshot == from_sql, url
+    app.config["PRODUCT_COLUMNAR_SNAPSHOT"] = True
+
+
+def test_snapshot_listings_match_sql(app, client):
+    for i in range(30):
+        create_product(client, i)
+    assert_matches_sql(app, client)
+
+    # Changes after the build are replayed from the change feed
+    for i in range(30, 36):
+        create_product(client, i)
+    with app.app_context():
+        ids = {product.slug: product.id for product in Product.query}
+    assert client.patch(f"/product/{ids['p3']}", json={"price": 101}).status_code == 200
+    assert client.delete(f"/product/{ids['p4']}").status_code == 200
+    assert_matches_sql(app, client)
+
+
+def test_failed_sync_is_retried(app, client, monkeypatch):
+    for i in range(12):
+        create_product(client, i)
+
+    rows_query = CatalogSnapshot._rows_query
+    failures = [0]
+
+    def failing_rows_query():
+        if failures[0]:
+            failures[0] -= 1
+            raise OperationalError("SELECT", {}, Exception("database is locked"))
+        return rows_query()
+
+    monkeypatch.setattr(CatalogSnapshot, "_rows_query", staticmethod(failing_rows_query))
+
+    # The first build fails (both before the listing and within it)
+    failures[0] = 2
+    assert client.get("/product/category/c1").status_code == 500
+
+    # Nothing was kept from the failed build, so the next request builds again
+    snapshot = app.extensions["product_catalog_snapshot"]
+    assert snapshot._size == 0
+    assert_matches_sql(app, client)
+    assert snapshot._size == 12
+
+    # A failed replay of the change feed keeps its position and is retried
+    for i in range(12, 16):
+        create_product(client, i)
+    failures[0] = 1
+    assert client.get("/product/category/c1").status_code == 500
+    assert_matches_sql(app, client)
+    assert snapshot._size == 16
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from app.model import Product
+from config import TestingDeveloping
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'group.db'}")
+    monkeypatch.setattr(TestingDeveloping, "PRODUCT_GROUP_COMMIT", True)
+    monkeypatch.setattr(TestingDeveloping, "PRODUCT_GROUP_COMMIT_MAX_DELAY_MS", 50)
+    app = create_app("testing")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def payload(i):
+    return {
+        "name": f"Product {i}",
+        "slug": f"p{i}",
+        "description": f"description {i}",
+        "price": 10 + i,
+        "brand": {"name": "B1"},
+        "category": {"name": "C1", "slug": "c1"},
+        "variants": [{"sku": f"sku-{i}", "stock": 1}]
+    }
+
+
+def test_concurrent_creates_are_batched_and_isolated(app):
+    with app.app_context():
+        commits = []
+        event.listen(db.engine, "commit", lambda connection: commits.append(1))
+
+    # 33 distinct products plus 7 duplicates of already-used slugs and SKUs
+    payloads = [payload(i) for i in range(33)] + [payload(i) for i in range(7)]
+
+    def post(data):
+        return app.test_client().post("/product", json=data).status_code
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as executor:
+        statuses = list(executor.map(post, payloads))
+
+    assert statuses.count(201) == 33
+    assert statuses.count(400) == 7
+    # Batched: far fewer commits than creates
+    assert len(commits) < len(payloads) / 2
+
+    # A failing item only rolled back its own savepoint
+    with app.app_context():
+        slugs = [slug for (slug,) in db.session.query(Product.slug)]
+    assert sorted(slugs) == sorted(f"p{i}" for i in range(33))
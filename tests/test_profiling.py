@@ -0,0 +1,31 @@
+from app import create_app, db
+from config import TestingDeveloping
+
+
+def test_profiling_per_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'profiling.db'}")
+    monkeypatch.setattr(TestingDeveloping, "PROFILING_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(TestingDeveloping, "PROFILING_ADMIN_TOKEN", "secret")
+
+    # Several apps share the api blueprint; each one decides on its own
+    monkeypatch.setattr(TestingDeveloping, "PROFILING_ENABLED", True)
+    profiled = [create_app("testing"), create_app("testing")]
+    monkeypatch.setattr(TestingDeveloping, "PROFILING_ENABLED", False)
+    unprofiled = create_app("testing")
+
+    for app in profiled:
+        client = app.test_client()
+        response = client.get("/product", headers={"X-Profile-Token": "secret"})
+        assert response.status_code == 200
+        assert "sql;dur=" in response.headers["Server-Timing"]
+        assert "Server-Timing" not in client.get("/product", headers={"X-Profile-Token": "wrong"}).headers
+
+    response = unprofiled.test_client().get("/product", headers={"X-Profile-Token": "secret"})
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert not unprofiled.before_request_funcs
+
+    for app in profiled + [unprofiled]:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,190 @@
+import sqlite3
+
+import pytest
+
+from app import create_app, db
+from app.product_service import ProductService
+from config import TestingDeveloping
+
+
+SHARDS = 3
+
+
+@pytest.fixture
+def shard_paths(tmp_path):
+    return [tmp_path / f"shard{i}.db" for i in range(SHARDS)]
+
+
+@pytest.fixture
+def app(tmp_path, shard_paths, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'global.db'}")
+    monkeypatch.setattr(TestingDeveloping, "PRODUCT_SHARDS", [f"sqlite:///{path}" for path in shard_paths])
+    app = create_app("testing")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    for engine in app.extensions["product_shards"].engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_product(client, i, name=None, brand="B0", price=None):
+    response = client.post("/product", json={
+        "name": name or f"Product {i}",
+        "slug": f"p{i}",
+        "description": f"description {i}",
+        "price": 100 + i,
+        "brand": {"name": brand},
+        "category": {"name": "C1", "slug": "c1"},
+        "variants": [{"sku": f"sku-{i}", "stock": 1, "price_override": price if price is not None else 10 + i}]
+    })
+    assert response.status_code == 201, response.json
+    return response
+
+
+def shard_rows(shard_paths, table="products", columns="slug, id"):
+    """Rows of `table` per shard, read directly from the shard files"""
+    rows = []
+    for path in shard_paths:
+        with sqlite3.connect(path) as connection:
+            rows.append(connection.execute(f"SELECT {columns} FROM {table}").fetchall())
+    return rows
+
+
+def ids_by_slug(shard_paths):
+    return {slug: product_id for rows in shard_rows(shard_paths) for slug, product_id in rows}
+
+
+def test_products_are_routed_to_their_shard(app, client, shard_paths, tmp_path):
+    for i in range(30):
+        create_product(client, i)
+
+    router = app.extensions["product_shards"]
+    rows = shard_rows(shard_paths)
+    assert sum(len(shard) for shard in rows) == 30
+    assert all(rows), "every shard should own some products"
+    for shard, shard_products in enumerate(rows):
+        for _, product_id in shard_products:
+            assert router.shard_for(product_id) == shard
+
+    # Variants live with their product; the global database has no product tables
+    for shard_products, shard_variants in zip(rows, shard_rows(shard_paths, "product_variants", "product_id")):
+        assert {product_id for (product_id,) in shard_variants} == {product_id for _, product_id in shard_products}
+    with sqlite3.connect(tmp_path / "global.db") as connection:
+        tables = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "products" not in tables and "brands" in tables
+
+    product_id = ids_by_slug(shard_paths)["p7"]
+    assert client.get(f"/product/{product_id}").json["name"] == "Product 7"
+
+    assert client.patch(f"/product/{product_id}", json={"name": "Renamed"}).status_code == 200
+    assert client.get(f"/product/{product_id}").json["name"] == "Renamed"
+
+    assert client.delete(f"/product/{product_id}").status_code == 200
+    assert client.get(f"/product/{product_id}").status_code == 404
+    assert "p7" not in ids_by_slug(shard_paths)
+    assert product_id not in {
+        row[0] for shard in shard_rows(shard_paths, "product_variants", "product_id") for row in shard
+    }
+
+
+def test_list_pages_merge_in_id_order(client, shard_paths):
+    for i in range(25):
+        create_product(client, i)
+
+    slugs = []
+    for page in range(1, 5):
+        response = client.get(f"/product?page={page}&per_page=7")
+        assert response.status_code == 200
+        assert response.json["meta"]["pagination"]["total"] == 25
+        slugs += [product["slug"] for product in response.json["data"]]
+
+    ids = ids_by_slug(shard_paths)
+    assert slugs == sorted(ids, key=ids.get)
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_brand_sort_by_price_merges_across_shards(client, shard_paths, sort_order):
+    for i in range(24):
+        # Repeating prices exercise the id tie-break
+        create_product(client, i, brand=f"B{i % 2}", price=(i * 7) % 5 + 1)
+
+    with sqlite3.connect(shard_paths[0].parent / "global.db") as connection:
+        (brand_id,) = connection.execute("SELECT id FROM brands WHERE name = 'B0'").fetchone()
+
+    slugs = []
+    for page in range(1, 5):
+        response = client.get(
+            f"/product/brand/{brand_id}?sort_by=price&sort_order={sort_order}&page={page}&per_page=4"
+        )
+        assert response.status_code == 200
+        slugs += [product["slug"] for product in response.json]
+
+    ids = ids_by_slug(shard_paths)
+    prices = {f"p{i}": (i * 7) % 5 + 1 for i in range(0, 24, 2)}
+    expected = sorted(prices, key=lambda slug: (prices[slug], ids[slug]), reverse=sort_order == "desc")
+    assert slugs == expected
+
+
+def test_search_merges_across_shards(client):
+    for i in range(20):
+        create_product(client, i, name=f"Red Shoe {i}" if i % 2 else f"Blue Hat {i}")
+
+    products = []
+    for page in range(1, 4):
+        response = client.get(f"/product/search?search=shoe&page={page}&per_page=4")
+        assert response.status_code == 200
+        products += response.json
+
+    assert sorted(product["slug"] for product in products) == sorted(f"p{i}" for i in range(1, 20, 2))
+    created = [product["created_at"] for product in products]
+    assert created == sorted(created, reverse=True)
+
+
+def test_watermark_counts_sum_across_shards(app, client, shard_paths):
+    for i in range(12):
+        create_product(client, i, brand=f"B{i % 3}")
+
+    with app.app_context():
+        watermark, error = ProductService.get_list_watermark("all")
+        assert error is None and watermark["count"] == 12
+        watermark, _ = ProductService.get_list_watermark("search", search_term="Product 1")
+        assert watermark["count"] == 3  # Product 1, 10, 11
+
+    etag = client.get("/product").headers["ETag"]
+    assert client.get("/product", headers={"If-None-Match": etag}).status_code == 304
+
+    client.delete(f"/product/{ids_by_slug(shard_paths)['p4']}")
+    with app.app_context():
+        assert ProductService.get_list_watermark("all")[0]["count"] == 11
+    assert client.get("/product", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_bulk_delete_across_shards(app, client, shard_paths):
+    for i in range(18):
+        create_product(client, i, brand="Doomed" if i >= 15 else "B0")
+
+    ids = ids_by_slug(shard_paths)
+    router = app.extensions["product_shards"]
+    doomed = [ids[f"p{i}"] for i in range(10)]
+    assert len({router.shard_for(product_id) for product_id in doomed}) > 1
+
+    response = client.post("/product/bulk-delete", json={"ids": doomed})
+    assert response.status_code == 200
+    assert response.json["deleted"] == 10
+    assert sorted(ids_by_slug(shard_paths)) == sorted(f"p{i}" for i in range(10, 18))
+    assert sum(len(shard) for shard in shard_rows(shard_paths, "product_variants", "product_id")) == 8
+
+    changes = client.get("/product/changes?limit=100").json["data"]
+    assert {change["product_id"] for change in changes if change["operation"] == "delete"} == set(doomed)
+
+    with sqlite3.connect(shard_paths[0].parent / "global.db") as connection:
+        (brand_id,) = connection.execute("SELECT id FROM brands WHERE name = 'Doomed'").fetchone()
+    response = client.post("/product/bulk-delete", json={"brand_id": brand_id})
+    assert response.json["deleted"] == 3
+    assert sorted(ids_by_slug(shard_paths)) == sorted(f"p{i}" for i in range(10, 15))
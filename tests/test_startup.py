@@ -0,0 +1,69 @@
+import sqlite3
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from config import TestingDeveloping
+
+
+def test_startup_within_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'startup.db'}")
+
+    app = create_app("testing")
+
+    timings = app.extensions["startup_timings"]
+    assert {"create_app", "serializers", "schema", "pool", "statements"} <= timings.keys()
+    assert timings["total"] < app.config["STARTUP_BUDGET_SECONDS"]
+
+    # The pipeline created the missing tables, so the app serves immediately
+    with app.app_context():
+        assert set(db.metadata.tables) <= set(inspect(db.engine).get_table_names())
+        db.engine.dispose()
+    assert app.test_client().get("/product").status_code == 200
+
+
+def test_startup_adds_missing_columns(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}")
+
+    # A database created before the effective price columns existed
+    app = create_app("testing")
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    with sqlite3.connect(path) as connection:
+        connection.execute("DROP INDEX ix_products_min_effective_price")
+        connection.execute("DROP INDEX ix_products_category_min_effective_price")
+        connection.execute("DROP INDEX ix_products_brand_min_effective_price")
+        connection.execute("ALTER TABLE products DROP COLUMN min_effective_price")
+        connection.execute("ALTER TABLE products DROP COLUMN max_effective_price")
+
+    app = create_app("testing")
+    assert "startup_failed_phase" not in app.extensions
+    with app.app_context():
+        columns = {column["name"] for column in inspect(db.engine).get_columns("products")}
+        db.engine.dispose()
+    assert {"min_effective_price", "max_effective_price"} <= columns
+    assert app.test_client().get("/product").status_code == 200
+
+
+def test_startup_failure_does_not_fail_create_app(tmp_path, monkeypatch):
+    path = tmp_path / "corrupt.db"
+    path.write_bytes(b"not a database" * 100)
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}")
+
+    app = create_app("testing")
+    assert app.extensions["startup_failed_phase"] == "schema"
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_startup_skipped_for_cli_commands(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingDeveloping, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'cli.db'}")
+    monkeypatch.setenv("FLASK_RUN_FROM_CLI", "true")
+
+    app = create_app("testing")
+    assert "startup_timings" not in app.extensions
+    with app.app_context():
+        assert not inspect(db.engine).get_table_names()
+        db.engine.dispose()